@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+'''
+Benchmark the mustache evaluation of Senza definitions generated from the bundled templates:
+the old YAML dump/render/parse round-trip vs. rendering the string leaves of the definition structure.
+
+Usage: python3 benchmarks/bench_evaluate.py [ITERATIONS]
+'''
+import importlib
+import os
+import sys
+import timeit
+
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from senza.utils import pystache_render, pystache_render_structure  # noqa
+
+TEMPLATES = ['bgapp', 'postgresapp', 'rediscluster', 'redisnode', 'webapp']
+
+VARIABLES = {'application_id': 'hello-world', 'docker_image': 'pierone.example.org/myteam/hello-world',
+             'instance_type': 't2.micro', 'mint_bucket': 'myorg-stups-mint', 'http_port': 8080,
+             'http_health_check_path': '/health', 'loadbalancer_scheme': 'internal', 'number_of_nodes': 2,
+             'discovery_domain': 'postgres.example.org', 'fsoptions': 'noatime', 'fstype': 'ext4',
+             'healthcheck_port': 8008, 'hosted_zone': 'example.org', 'postgres_port': 5432,
+             'scalyr_account_key': 'secret', 'snapshot_id': 'snap-123', 'spilo_sg_id': 'sg-123',
+             'volume_iops': 300, 'volume_size': 50, 'volume_type': 'gp2', 'wal_s3_bucket': 'myorg-wal',
+             'use_ebs': True, 'ebs_optimized': True}
+
+CONTEXT = {'SenzaInfo': {'StackName': 'hello-world', 'StackVersion': '42'},
+           'SenzaComponents': [],
+           'Arguments': {'ImageVersion': '1.0', 'version': '42'},
+           'AccountInfo': {'Region': 'eu-west-1'}}
+
+
+def load_definitions():
+    definitions = {}
+    for name in TEMPLATES:
+        module = importlib.import_module('senza.templates.{}'.format(name))
+        definition = yaml.safe_load(module.generate_definition(VARIABLES))
+        definition.pop('SenzaInfo')
+        definitions[name] = definition
+    return definitions
+
+
+def render_yaml_roundtrip(definition):
+    template = yaml.dump(definition, default_flow_style=False)
+    return yaml.safe_load(pystache_render(template, CONTEXT))
+
+
+def render_structure(definition):
+    return pystache_render_structure(definition, CONTEXT)
+
+
+def main(iterations: int):
+    print('{:<15} {:>12} {:>12} {:>8}'.format('template', 'yaml [ms]', 'struct [ms]', 'speedup'))
+    for name, definition in sorted(load_definitions().items()):
+        assert render_yaml_roundtrip(definition) == render_structure(definition)
+        old = timeit.timeit(lambda: render_yaml_roundtrip(definition), number=iterations) / iterations * 1000
+        new = timeit.timeit(lambda: render_structure(definition), number=iterations) / iterations * 1000
+        print('{:<15} {:>12.3f} {:>12.3f} {:>7.1f}x'.format(name, old, new, old / new))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+'''
+Benchmark the conversion of EC2 API timestamps (instance launch times, image creation dates):
+strptime plus a UTC offset computed for every call vs. the precompiled parser of senza.aws.parse_time.
+
+Usage: python3 benchmarks/bench_parse_time.py [TIMESTAMPS]
+'''
+import datetime
+import os
+import random
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from senza.aws import parse_time  # noqa
+
+
+def parse_time_strptime(s: str) -> float:
+    try:
+        utc = datetime.datetime.strptime(s, '%Y-%m-%dT%H:%M:%S.%fZ')
+        ts = time.time()
+        utc_offset = datetime.datetime.fromtimestamp(ts) - datetime.datetime.utcfromtimestamp(ts)
+        local = utc + utc_offset
+        return local.timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def generate_timestamps(count: int) -> list:
+    start = datetime.datetime(2015, 1, 1)
+    return [(start + datetime.timedelta(seconds=random.randrange(10 ** 8))).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+            for i in range(count)]
+
+
+def main(count: int):
+    # the old implementation is only exact if the UTC offset did not change (daylight saving time)
+    os.environ['TZ'] = 'UTC'
+    time.tzset()
+    timestamps = generate_timestamps(count)
+    assert [parse_time_strptime(s) for s in timestamps] == [parse_time(s) for s in timestamps]
+
+    old = timeit.timeit(lambda: [parse_time_strptime(s) for s in timestamps], number=1) * 1000
+    new = timeit.timeit(lambda: [parse_time(s) for s in timestamps], number=1) * 1000
+    print('{:<12} {:>12} {:>12} {:>8}'.format('timestamps', 'old [ms]', 'new [ms]', 'speedup'))
+    print('{:<12} {:>12.1f} {:>12.1f} {:>7.1f}x'.format(count, old, new, old / new))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
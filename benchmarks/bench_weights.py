@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+'''
+Benchmark the calculation of the new weights of a domain's records ("senza traffic"):
+the legacy calculation (senza traffic --legacy-weights) vs. the exact solver of senza.weights,
+for domains with a few versions getting traffic and many dark launched versions.
+
+Usage: python3 benchmarks/bench_weights.py [REPETITIONS]
+'''
+import collections
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from senza.traffic import calculate_legacy_weights, calculate_exact_weights, FULL_PERCENTAGE  # noqa
+
+
+def generate_domain(versions: int, lit: int):
+    '''Weights of the records of a domain: the LIT versions before the newest (dark) version get traffic'''
+    identifier_versions = collections.OrderedDict(('app-v{}'.format(i), 'v{}'.format(i)) for i in range(versions))
+    # a plain dict like the known record weights of senza.traffic.get_weights
+    weights = dict.fromkeys(identifier_versions, 0)
+    cuts = sorted(random.sample(range(1, FULL_PERCENTAGE), lit - 1))
+    for identifier, (a, b) in zip(list(weights)[-lit - 1:-1], zip([0] + cuts, cuts + [FULL_PERCENTAGE])):
+        weights[identifier] = b - a
+    return weights, identifier_versions
+
+
+def calculate(function, weights, identifier_versions, identifier, percentage):
+    partial = [w for i, w in weights.items() if i != identifier and w > 0]
+    return function(identifier, weights, len(partial), sum(partial), percentage, identifier_versions)
+
+
+def main(repetitions: int):
+    random.seed(42)
+    print('{:<10} {:>6} {:>12} {:>12} {:>8}'.format('versions', 'lit', 'legacy [us]', 'exact [us]', 'speedup'))
+    for versions, lit in [(4, 3), (20, 5), (100, 5), (500, 5), (500, 50)]:
+        weights, identifier_versions = generate_domain(versions, lit)
+        # shift 10% to the newest (dark) version
+        args = (weights, identifier_versions, 'app-v{}'.format(versions - 1), 10 * FULL_PERCENTAGE // 100)
+        for function in calculate_legacy_weights, calculate_exact_weights:
+            new_weights = calculate(function, *args)[0]
+            assert sum(new_weights.values()) == FULL_PERCENTAGE
+        # the fastest of a few runs is the least disturbed by other processes
+        legacy = min(timeit.repeat(lambda: calculate(calculate_legacy_weights, *args),
+                                   number=repetitions, repeat=5)) * 10 ** 6 / repetitions
+        exact = min(timeit.repeat(lambda: calculate(calculate_exact_weights, *args),
+                                  number=repetitions, repeat=5)) * 10 ** 6 / repetitions
+        print('{:<10} {:>6} {:>12.1f} {:>12.1f} {:>7.1f}x'.format(versions, lit, legacy, exact, legacy / exact))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -1,21 +1,86 @@
 import collections
 import datetime
 import functools
-import boto.cloudformation
-import boto.ec2
-import boto.iam
+import random
+import re
 import time
-import boto3
+
+from senza import cache
+from senza.connections import get_connection, get_client
+
+# NOTE: boto and boto3 are imported in the functions using them to keep the CLI startup time low
+
+# regions supported by boto (see boto/endpoints.json), used to validate the region without connecting
+KNOWN_REGIONS = frozenset(['ap-northeast-1', 'ap-northeast-2', 'ap-south-1', 'ap-southeast-1', 'ap-southeast-2',
+                           'ca-central-1', 'cn-north-1', 'eu-central-1', 'eu-west-1', 'eu-west-2', 'sa-east-1',
+                           'us-east-1', 'us-east-2', 'us-gov-west-1', 'us-west-1', 'us-west-2'])
+
+THROTTLING_ERROR_CODES = frozenset(['Throttling', 'ThrottlingException', 'RequestLimitExceeded'])
+
+# seconds to keep slow-changing metadata in the on-disk cache
+SECURITY_GROUP_CACHE_TTL = 600
+SSL_CERTIFICATE_CACHE_TTL = 3600
+TOPIC_CACHE_TTL = 3600
+ACCOUNT_ALIAS_CACHE_TTL = 86400
+TAUPAGE_IMAGES_CACHE_TTL = 3600
+
+# maximum number of image IDs per DescribeImages call
+MAX_IMAGE_IDS_PER_CALL = 100
+
+# ISO 8601 UTC timestamps as returned by the EC2 API, e.g. "2015-04-14T19:09:01.000Z"
+TIMESTAMP_PATTERN = re.compile(r'^(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)\.(\d{1,6})Z$')
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def is_throttling_error(e: Exception) -> bool:
+    '''
+    >>> from boto.exception import BotoServerError
+    >>> is_throttling_error(BotoServerError(400, 'Bad Request', {'Error': {'Code': 'Throttling'}}))
+    True
+
+    >>> is_throttling_error(BotoServerError(400, 'Bad Request', {'Error': {'Code': 'ValidationError'}}))
+    False
+
+    >>> is_throttling_error(ValueError())
+    False
+    '''
+    import boto.exception
+    return isinstance(e, boto.exception.BotoServerError) and e.error_code in THROTTLING_ERROR_CODES
+
+
+def retry_throttled(func, max_tries: int = 5, base_delay: float = 0.5):
+    '''Wrap func to retry AWS API calls rejected by rate limiting (exponential backoff with jitter)'''
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(max_tries):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if not is_throttling_error(e) or attempt == max_tries - 1:
+                    raise
+                time.sleep(base_delay * (2 ** attempt) * (1 + random.random()))
+    return wrapper
 
 
 def get_security_group(region: str, sg_name: str):
-    conn = boto.ec2.connect_to_region(region)
+    conn = get_connection('ec2', region)
     all_security_groups = conn.get_all_security_groups()
     for _sg in all_security_groups:
         if _sg.name == sg_name:
             return _sg
 
 
+def get_security_group_ids(region: str, refresh: bool = False) -> dict:
+    '''Get the name to ID index of all security groups in the region (fetched once per run)'''
+    def fetch():
+        conn = get_connection('ec2', region)
+        ids = {}
+        for sg in conn.get_all_security_groups():
+            ids.setdefault(sg.name, sg.id)
+        return ids
+    return cache.get_or_fetch(region, 'security-groups', SECURITY_GROUP_CACHE_TTL, fetch, refresh=refresh)
+
+
 def resolve_security_groups(security_groups: list, region: str):
     result = []
     for security_group in security_groups:
@@ -24,20 +89,31 @@ def resolve_security_groups(security_groups: list, region: str):
         elif security_group.startswith('sg-'):
             result.append(security_group)
         else:
-            sg = get_security_group(region, security_group)
-            if not sg:
+            sg_id = get_security_group_ids(region).get(security_group)
+            if not sg_id:
+                # the security group might have been created after the (cached) index was built
+                sg_id = get_security_group_ids(region, refresh=True).get(security_group)
+            if not sg_id:
                 raise ValueError('Security Group "{}" does not exist'.format(security_group))
-            result.append(sg.id)
+            result.append(sg_id)
 
     return result
 
 
+def get_server_certificates(region: str) -> list:
+    '''Get name and ARN of all IAM server certificates'''
+    def fetch():
+        iam_conn = get_connection('iam', region)
+        response = iam_conn.list_server_certs()
+        response = response['list_server_certificates_response']
+        certs = response['list_server_certificates_result']['server_certificate_metadata_list']
+        return [{'server_certificate_name': cert['server_certificate_name'], 'arn': cert['arn']} for cert in certs]
+    return cache.get_or_fetch(region, 'server-certificates', SSL_CERTIFICATE_CACHE_TTL, fetch)
+
+
 def find_ssl_certificate_arn(region, pattern):
     '''Find the a matching SSL cert and return its ARN'''
-    iam_conn = boto.iam.connect_to_region(region)
-    response = iam_conn.list_server_certs()
-    response = response['list_server_certificates_response']
-    certs = response['list_server_certificates_result']['server_certificate_metadata_list']
+    certs = get_server_certificates(region)
     candidates = set()
     for cert in certs:
         # only consider matching SSL certs or use the only one available
@@ -52,16 +128,31 @@ def find_ssl_certificate_arn(region, pattern):
 
 def parse_time(s: str) -> float:
     '''
-    >>> parse_time('2015-04-14T19:09:01.000Z') > 0
+    Convert an ISO 8601 UTC timestamp to seconds since the epoch (None if it cannot be parsed)
+
+    >>> parse_time('2015-04-14T19:09:01.000Z')
+    1429038541.0
+
+    >>> parse_time('2015-04-14T19:09:01.5Z')
+    1429038541.5
+
+    >>> parse_time('2015-13-14T19:09:01.000Z') is None
+    True
+
+    >>> parse_time(None) is None
     True
     '''
     try:
-        utc = datetime.datetime.strptime(s, '%Y-%m-%dT%H:%M:%S.%fZ')
-        ts = time.time()
-        utc_offset = datetime.datetime.fromtimestamp(ts) - datetime.datetime.utcfromtimestamp(ts)
-        local = utc + utc_offset
-        return local.timestamp()
-    except:
+        match = TIMESTAMP_PATTERN.match(s)
+        if match:
+            year, month, day, hour, minute, second, fraction = match.groups()
+            utc = datetime.datetime(int(year), int(month), int(day), int(hour), int(minute), int(second),
+                                    int(fraction.ljust(6, '0')))
+        else:
+            # less common spellings strptime accepts as well (e.g. single digit fields)
+            utc = datetime.datetime.strptime(s, '%Y-%m-%dT%H:%M:%S.%fZ')
+        return (utc - EPOCH).total_seconds()
+    except (TypeError, ValueError):
         return None
 
 
@@ -81,6 +172,14 @@ def get_required_capabilities(data: dict):
     return capabilities
 
 
+def get_topic_arns(region: str) -> list:
+    def fetch():
+        sns = get_connection('sns', region)
+        response = sns.get_all_topics()
+        return [obj['TopicArn'] for obj in response['ListTopicsResponse']['ListTopicsResult']['Topics']]
+    return cache.get_or_fetch(region, 'topics', TOPIC_CACHE_TTL, fetch)
+
+
 def resolve_topic_arn(region, topic):
     '''
     >>> resolve_topic_arn(None, 'arn:123')
@@ -90,12 +189,10 @@ def resolve_topic_arn(region, topic):
         topic_arn = topic
     else:
         # resolve topic name to ARN
-        sns = boto.sns.connect_to_region(region)
-        response = sns.get_all_topics()
         topic_arn = False
-        for obj in response['ListTopicsResponse']['ListTopicsResult']['Topics']:
-            if obj['TopicArn'].endswith(topic):
-                topic_arn = obj['TopicArn']
+        for arn in get_topic_arns(region):
+            if arn.endswith(topic):
+                topic_arn = arn
 
     return topic_arn
 
@@ -125,14 +222,75 @@ class SenzaStackSummary:
         return self.stack_name == other.stack_name
 
 
+def is_exact_query(stack_refs: list, all=False) -> bool:
+    '''
+    Can the stacks be fetched by name (DescribeStacks) instead of listing all stacks of the region?
+
+    Deleted stacks can only be described by their ID, i.e. we need to list them.
+
+    >>> is_exact_query([StackReference(name='foobar', version='1')])
+    True
+
+    >>> is_exact_query([StackReference(name='foobar', version='1'), StackReference(name='other', version=None)])
+    False
+
+    >>> is_exact_query([StackReference(name='foobar', version='1')], all=True)
+    False
+
+    >>> is_exact_query([])
+    False
+    '''
+    return bool(stack_refs) and not all and not any(not ref.version for ref in stack_refs)
+
+
+def describe_stack(cf, stack_name: str):
+    '''Get the (not deleted) stack with the given name, None if it does not exist'''
+    import boto.exception
+    try:
+        stacks = retry_throttled(cf.describe_stacks)(stack_name_or_id=stack_name)
+    except boto.exception.BotoServerError as e:
+        if e.error_code == 'ValidationError' and 'does not exist' in (e.message or ''):
+            return None
+        raise
+    for stack in stacks:
+        if not hasattr(stack, 'template_description'):
+            # DescribeStacks calls it "Description", ListStacks "TemplateDescription"
+            stack.template_description = getattr(stack, 'description', None)
+        return stack
+    return None
+
+
+def list_stacks(cf, status_filter):
+    '''Iterate over the stack summaries page by page (ListStacks returns up to 100 per call)'''
+    page = retry_throttled(cf.list_stacks)(stack_status_filters=status_filter)
+    while True:
+        yield from page
+        next_token = getattr(page, 'next_token', None)
+        if not next_token:
+            break
+        page = retry_throttled(cf.list_stacks)(stack_status_filters=status_filter, next_token=next_token)
+
+
 def get_stacks(stack_refs: list, region, all=False):
-    cf = boto.cloudformation.connect_to_region(region)
+    '''
+    Iterate over the stacks matching the stack references (all stacks if no reference is given)
+
+    Stacks referenced by name and version are described directly, otherwise the (not deleted) stacks
+    are listed page by page and yielded as soon as their page arrived.
+    '''
+    cf = get_connection('cloudformation', region)
+    if is_exact_query(stack_refs, all):
+        for stack_name in collections.OrderedDict.fromkeys(ref.cf_stack_name() for ref in stack_refs):
+            stack = describe_stack(cf, stack_name)
+            if stack:
+                yield SenzaStackSummary(stack)
+        return
+
     if all:
         status_filter = None
     else:
         status_filter = [st for st in cf.valid_states if st != 'DELETE_COMPLETE']
-    stacks = cf.list_stacks(stack_status_filters=status_filter)
-    for stack in stacks:
+    for stack in list_stacks(cf, status_filter):
         if not stack_refs or matches_any(stack.stack_name, stack_refs):
             yield SenzaStackSummary(stack)
 
@@ -162,8 +320,55 @@ def matches_any(cf_stack_name: str, stack_refs: list):
     return False
 
 
+def get_stack_name_filter(stack_refs: list) -> list:
+    '''
+    Get the values of an EC2 "tag:aws:cloudformation:stack-name" filter for the stack references
+
+    The filter only narrows the result server-side, use matches_any to check the stack name.
+
+    >>> get_stack_name_filter([StackReference(name='foobar', version='1'), StackReference(name='other', version=None)])
+    ['foobar-1', 'other-*']
+    '''
+    return [ref.cf_stack_name() if ref.version else '{}-*'.format(ref.name) for ref in stack_refs]
+
+
+def get_image_info(image) -> dict:
+    '''Get the (JSON serializable) attributes of an AMI shown by "senza images"'''
+    return {'id': image.id,
+            'name': image.name,
+            'owner_id': image.owner_id,
+            'description': image.description,
+            'creation_date': image.creationDate}
+
+
+def get_images(region: str, image_ids: list) -> list:
+    '''Get the AMIs with the given IDs (in chunks of MAX_IMAGE_IDS_PER_CALL IDs per DescribeImages call)
+
+    AMIs which do not exist anymore (or are not shared with us anymore) are skipped:
+    the IDs are passed as "image-id" filter because DescribeImages fails for unknown ImageIds.
+    '''
+    conn = get_connection('ec2', region)
+    image_ids = sorted(set(image_ids))
+    images = []
+    for i in range(0, len(image_ids), MAX_IMAGE_IDS_PER_CALL):
+        chunk = image_ids[i:i + MAX_IMAGE_IDS_PER_CALL]
+        images.extend(get_image_info(image)
+                      for image in retry_throttled(conn.get_all_images)(filters={'image-id': chunk}))
+    return images
+
+
+def get_taupage_images(region: str) -> list:
+    '''Get all available Taupage AMIs (the catalogue only changes with new Taupage releases)'''
+    def fetch():
+        conn = get_connection('ec2', region)
+        filters = {'name': '*Taupage-*',
+                   'state': 'available'}
+        return [get_image_info(image) for image in retry_throttled(conn.get_all_images)(filters=filters)]
+    return cache.get_or_fetch(region, 'taupage-images', TAUPAGE_IMAGES_CACHE_TTL, fetch)
+
+
 def get_account_id():
-    conn = boto3.client('iam')
+    conn = get_client('iam')
     try:
         own_user = conn.get_user()['User']
     except:
@@ -189,8 +394,11 @@ def get_account_id():
 
 
 def get_account_alias():
-    conn = boto3.client('iam')
-    return conn.list_account_aliases()['AccountAliases'][0]
+    def fetch():
+        conn = get_client('iam')
+        return conn.list_account_aliases()['AccountAliases'][0]
+    # IAM is a global service, the alias does not depend on the region
+    return cache.get_or_fetch('global', 'account-alias', ACCOUNT_ALIAS_CACHE_TTL, fetch)
 
 
 class StackReference(collections.namedtuple('StackReference', 'name version')):
@@ -0,0 +1,130 @@
+'''
+Local caches for slow-changing AWS metadata (security groups, AMIs, subnets, hosted zones, ..)
+
+Values are kept in memory for the lifetime of the process and additionally
+stored as JSON files below ~/.cache/senza (see SENZA_CACHE_DIR), keyed by AWS account and region,
+so that repeated runs (e.g. "senza print" during template development) can skip the AWS calls.
+'''
+import collections
+import configparser
+import hashlib
+import json
+import os
+import time
+
+DEFAULT_CACHE_DIR = '~/.cache/senza'
+
+# seconds to remember which AWS account an access key belongs to
+ACCOUNT_ID_TTL = 86400
+
+settings = {'enabled': True, 'refresh': False}
+
+# cache hits and misses of the current process (for reporting)
+stats = collections.Counter()
+
+_memory = {}
+
+
+def configure(enabled: bool = True, refresh: bool = False):
+    '''Enable/disable the on-disk cache or force refreshing all entries used in this run'''
+    settings['enabled'] = enabled
+    settings['refresh'] = refresh
+
+
+def get_cache_dir() -> str:
+    return os.path.expanduser(os.environ.get('SENZA_CACHE_DIR', DEFAULT_CACHE_DIR))
+
+
+def is_disk_cache_enabled() -> bool:
+    return settings['enabled'] and not os.environ.get('SENZA_NO_CACHE')
+
+
+def get_credentials_id():
+    '''Identify the current AWS credentials without calling AWS (returns None if no access key is configured)'''
+    access_key = os.environ.get('AWS_ACCESS_KEY_ID')
+    if not access_key:
+        config = configparser.ConfigParser()
+        try:
+            config.read(os.path.expanduser(os.environ.get('AWS_SHARED_CREDENTIALS_FILE', '~/.aws/credentials')))
+            access_key = config[os.environ.get('AWS_PROFILE', 'default')]['aws_access_key_id']
+        except (KeyError, configparser.Error, OSError, UnicodeDecodeError):
+            # no such profile or an unreadable credentials file
+            access_key = None
+    if not access_key:
+        return None
+    return hashlib.sha1(access_key.encode('utf-8')).hexdigest()[:16]
+
+
+def read(path: str, ttl: int):
+    '''Read a cache file, returns None if it does not exist, is invalid or older than TTL seconds'''
+    try:
+        if os.path.getmtime(path) + ttl < time.time():
+            return None
+        with open(path) as fd:
+            return json.load(fd)
+    except (OSError, ValueError):
+        return None
+
+
+def write(path: str, value):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to temporary file first to not leave broken cache files behind
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'w') as fd:
+            json.dump(value, fd)
+        os.replace(tmp_path, path)
+    except OSError:
+        # the cache is only an optimization, never fail because of it
+        pass
+
+
+def lookup(key: tuple, path: str, ttl: int, fetch, refresh: bool = False):
+    if not refresh and key in _memory:
+        stats['hits'] += 1
+        return _memory[key]
+
+    value = None
+    if path and not refresh and not settings['refresh']:
+        value = read(path, ttl)
+    if value is None:
+        stats['misses'] += 1
+        value = fetch()
+        if path and value is not None:
+            write(path, value)
+    else:
+        stats['hits'] += 1
+    _memory[key] = value
+    return value
+
+
+def get_account_id():
+    '''Get the AWS account ID of the current credentials (cached per access key)'''
+    # imported here as senza.aws uses this module
+    from senza.aws import get_account_id as fetch_account_id
+
+    credentials_id = get_credentials_id()
+    path = None
+    if credentials_id is not None and is_disk_cache_enabled():
+        path = os.path.join(get_cache_dir(), 'credentials', '{}.json'.format(credentials_id))
+    return lookup((credentials_id, None, 'account-id'), path, ACCOUNT_ID_TTL, fetch_account_id)
+
+
+def get_or_fetch(region: str, name: str, ttl: int, fetch, refresh: bool = False):
+    '''Return the cached value for the given region and name, call fetch() on a cache miss
+
+    The value returned by fetch() must be JSON serializable.
+    '''
+    credentials_id = get_credentials_id()
+    path = None
+    if credentials_id is not None and is_disk_cache_enabled():
+        account_id = get_account_id()
+        if account_id:
+            path = os.path.join(get_cache_dir(), account_id, region, '{}.json'.format(name))
+    return lookup((credentials_id, region, name), path, ttl, fetch, refresh)
+
+
+def clear():
+    '''Reset the in-memory cache and statistics (files on disk are left untouched)'''
+    _memory.clear()
+    stats.clear()
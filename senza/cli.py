@@ -6,40 +6,37 @@ import datetime
 import functools
 import importlib
 import ipaddress
+import itertools
 import os
 import re
 import sys
 import json
-from urllib.error import URLError
-import dns.resolver
 import time
 
-from boto.exception import BotoServerError
 import click
 from clickclick import AliasedGroup, Action, choice, info, FloatRange, OutputFormat, fatal_error
-from clickclick.console import print_table
-import requests
+from clickclick.console import print_table, format as format_value
 import yaml
 import base64
-import boto.cloudformation
-import boto.vpc
-import boto.ec2
-import boto.ec2.autoscale
-import boto.iam
-import boto.sns
-import boto.route53
-import boto3
 
 from .aws import parse_time, get_required_capabilities, resolve_topic_arn, get_stacks, StackReference, matches_any, \
-    get_account_id, get_account_alias
+    get_account_alias, retry_throttled, KNOWN_REGIONS, get_stack_name_filter, get_images, get_taupage_images
+from .cache import get_account_id
+from . import cache
 from .components import get_component, evaluate_template
 import senza
-from urllib.request import urlopen
 from urllib.parse import quote
-from .traffic import change_version_traffic, print_version_traffic
-from .utils import named_value, camel_case_to_underscore, pystache_render
+from .utils import named_value, camel_case_to_underscore, pystache_render, parallel_map, DEFAULT_MAX_WORKERS, \
+    parse_interval
+from .watch import Screen, Snapshot, get_stack_indicator
+from .route53 import get_record_index
+from .connections import get_connection, get_client
+from . import connections
 
 
+# NOTE: boto, boto3, requests and the Senza components are imported by the commands using them,
+# this keeps the startup time low (e.g. for "senza --version" or "senza list")
+
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
 STYLES = {
@@ -102,6 +99,9 @@ class DefinitionParamType(click.ParamType):
     name = 'definition'
 
     def convert(self, value, param, ctx):
+        from urllib.error import URLError
+        from urllib.request import urlopen
+
         if isinstance(value, str):
             try:
                 url = value if '://' in value else 'file://{}'.format(quote(os.path.abspath(value)))
@@ -148,19 +148,70 @@ json_output_option = click.option('-o', '--output', type=click.Choice(['json', '
 watch_option = click.option('-W', is_flag=True, help='Auto update the screen every 2 seconds')
 watchrefresh_option = click.option('-w', '--watch', type=click.IntRange(1, 300), metavar='SECS',
                                    help='Auto update the screen every X seconds')
-
-
-def watching(w: bool, watch: int):
+no_cache_option = click.option('--no-cache', is_flag=True,
+                               help='Do not use the local cache of AWS metadata (~/.cache/senza)')
+refresh_cache_option = click.option('--refresh-cache', is_flag=True,
+                                    help='Refresh all entries of the local AWS metadata cache used by this command')
+parallelism_option = click.option('--parallelism', envvar='SENZA_PARALLELISM', type=click.IntRange(1, 100),
+                                  default=DEFAULT_MAX_WORKERS, metavar='N',
+                                  help='Maximum number of concurrent AWS API calls (default: {})'.format(
+                                      DEFAULT_MAX_WORKERS))
+stream_option = click.option('--stream', is_flag=True,
+                             help='Print unsorted rows as they arrive (requires "-o tsv" or "-o json" for JSON lines)')
+
+
+def watching(w: bool, watch: int, screen: Screen = None, clear: bool = True):
+    '''Yield the refresh number once or (in watch mode) every X seconds
+
+    The screen is cleared unless an incremental Screen is used.'''
+    clear = clear and not screen
     if w and not watch:
         watch = 2
-    if watch:
+    if watch and clear:
         click.clear()
     yield 0
     if watch:
-        while True:
+        for refresh in itertools.count(1):
             time.sleep(watch)
-            click.clear()
-            yield 0
+            if clear:
+                click.clear()
+            yield refresh
+
+
+def check_stream_option(stream: bool, output: str, watch: bool):
+    if stream and output not in ('json', 'tsv'):
+        raise click.UsageError('--stream requires the "tsv" or "json" output format')
+    if stream and watch:
+        raise click.UsageError('--stream cannot be used in watch mode')
+
+
+def check_ramp_options(steps, interval, min_healthy, batch):
+    if steps and batch:
+        raise click.UsageError('--steps cannot be used with --batch')
+    if not steps and (interval is not None or min_healthy is not None):
+        raise click.UsageError('--interval and --min-healthy require --steps')
+
+
+def print_row_lines(cols: list, rows, output: str, header: bool = True):
+    '''Print the rows one per line (TSV or JSON lines) as they are generated, without keeping them in memory
+
+    Without header, the rows can be appended to earlier output (e.g. "senza events --tail").
+    '''
+    if output == 'tsv' and header:
+        click.echo('\t'.join(cols))
+    for row in rows:
+        if output == 'json':
+            click.echo(json.dumps({col: row.get(col) for col in cols}, sort_keys=True))
+        else:
+            click.echo('\t'.join(format_value(col, row.get(col)) for col in cols))
+
+
+def print_rows(cols: list, rows, output: str, stream: bool, key, **kwargs):
+    '''Print the rows as table sorted by key or (with --stream) line by line as they arrive'''
+    if stream:
+        print_row_lines(cols, rows, output)
+    else:
+        print_table(cols, sorted(rows, key=key), **kwargs)
 
 # from AWS docs:
 # Stack name must contain only alphanumeric characters (case sensitive)
@@ -168,6 +219,38 @@ def watching(w: bool, watch: int):
 STACK_NAME_PATTERN = re.compile(r'^[a-zA-Z][a-zA-Z0-9-]*$')
 VERSION_PATTERN = re.compile(r'^[a-zA-Z0-9]+$')
 
+DEFAULT_RAMP_INTERVAL = 5 * 60
+
+# error codes of boto3 (botocore) requests signed with expired temporary credentials
+BOTO3_EXPIRED_ERROR_CODES = frozenset(['ExpiredToken', 'ExpiredTokenException', 'RequestExpired'])
+
+
+def validate_steps(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        steps = [float(step) for step in value.split(',')]
+    except ValueError:
+        raise click.BadParameter('Steps must be a comma separated list of percentages, e.g. "1,5,25,50,100"')
+    if not all(0 <= step <= 100 for step in steps):
+        raise click.BadParameter('Steps must be percentages between 0 and 100')
+    pairs = list(zip(steps, steps[1:]))
+    if not (all(a < b for a, b in pairs) or all(a > b for a, b in pairs)):
+        raise click.BadParameter('Steps must be strictly increasing or strictly decreasing, e.g. "1,5,25,50,100"')
+    return steps
+
+
+def validate_interval(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        interval = parse_interval(value)
+    except ValueError:
+        interval = -1
+    if interval < 0:
+        raise click.BadParameter('Interval must be a duration like "30s", "5m" or "1h"')
+    return interval
+
 
 def validate_version(ctx, param, value):
     if not VERSION_PATTERN.match(value):
@@ -191,14 +274,21 @@ def print_version(ctx, param, value):
     ctx.exit()
 
 
+def enable_debug(ctx, param, value):
+    '''Print the number of AWS connections and TLS handshakes when the command finished'''
+    if not value or ctx.resilient_parsing:
+        return
+    connections.count_tls_handshakes()
+    ctx.call_on_close(connections.print_stats)
+
+
 def evaluate(definition, args, account_info, force: bool):
     # extract Senza* meta information
     info = definition.pop("SenzaInfo")
     info["StackVersion"] = args.version
 
-    template = yaml.dump(definition, default_flow_style=False)
-    definition = evaluate_template(template, info, [], args, account_info)
-    definition = yaml.load(definition)
+    # render mustache templates in all strings of the definition (without serializing it)
+    definition = evaluate_template(definition, info, [], args, account_info)
 
     components = definition.pop("SenzaComponents", [])
 
@@ -220,27 +310,35 @@ def evaluate(definition, args, account_info, force: bool):
         definition = componentfn(definition, configuration, args, info, force)
 
     # throw executed template to templating engine and provide all information for substitutions
-    template = yaml.dump(definition, default_flow_style=False)
-    definition = evaluate_template(template, info, components, args, account_info)
-    definition = yaml.load(definition)
+    definition = evaluate_template(definition, info, components, args, account_info)
 
     return definition
 
 
+def print_cache_stats():
+    if cache.stats:
+        click.secho('AWS metadata cache: {} hits, {} misses'.format(cache.stats['hits'], cache.stats['misses']),
+                    fg='blue', err=True)
+
+
 def handle_exceptions(func):
     @functools.wraps(func)
     def wrapper():
         try:
             func()
-        except boto.exception.NoAuthHandlerFound as e:
-            sys.stdout.flush()
-            sys.stderr.write('No AWS credentials found. ' +
-                             'Use the "mai" command line tool to get a temporary access key\n')
-            sys.stderr.write('or manually configure either ~/.aws/credentials ' +
-                             'or AWS_ACCESS_KEY_ID/AWS_SECRET_ACCESS_KEY.\n')
-            sys.exit(1)
-        except BotoServerError as e:
-            if is_credentials_expired_error(e):
+        except Exception as e:
+            # boto is imported lazily, only pay for the import if something went wrong
+            import boto.exception
+            import botocore.exceptions
+            # credentials are not checked up front, the first API call tells us if they are missing or expired
+            if isinstance(e, (boto.exception.NoAuthHandlerFound, botocore.exceptions.NoCredentialsError)):
+                sys.stdout.flush()
+                sys.stderr.write('No AWS credentials found. ' +
+                                 'Use the "mai" command line tool to get a temporary access key\n')
+                sys.stderr.write('or manually configure either ~/.aws/credentials ' +
+                                 'or AWS_ACCESS_KEY_ID/AWS_SECRET_ACCESS_KEY.\n')
+                sys.exit(1)
+            elif is_credentials_expired_error(e):
                 sys.stdout.flush()
                 sys.stderr.write('AWS credentials have expired. ' +
                                  'Use the "mai" command line tool to get a new temporary access key.\n')
@@ -253,6 +351,8 @@ def handle_exceptions(func):
 @click.group(cls=AliasedGroup, context_settings=CONTEXT_SETTINGS)
 @click.option('-V', '--version', is_flag=True, callback=print_version, expose_value=False, is_eager=True,
               help='Print the current version number and exit.')
+@click.option('--debug', is_flag=True, callback=enable_debug, expose_value=False, envvar='SENZA_DEBUG',
+              help='Print the number of AWS connections and TLS handshakes.')
 def cli():
     pass
 
@@ -314,7 +414,7 @@ class AccountArguments:
     def Domain(self):
         attr = getattr(self, '__Domain', None)
         if attr is None:
-            conn = boto3.client('route53')
+            conn = get_client('route53')
             domainlist = conn.list_hosted_zones()['HostedZones']
             if len(domainlist) == 0:
                 raise AttributeError('No Domain configured')
@@ -338,7 +438,13 @@ class AccountArguments:
         return attr
 
 
-def is_credentials_expired_error(e: BotoServerError) -> bool:
+def is_credentials_expired_error(e) -> bool:
+    import boto.exception
+    import botocore.exceptions
+    if isinstance(e, botocore.exceptions.ClientError):
+        return e.response.get('Error', {}).get('Code') in BOTO3_EXPIRED_ERROR_CODES
+    if not isinstance(e, boto.exception.BotoServerError):
+        return False
     return (e.status == 400 and 'request has expired' in e.message.lower()) or \
            (e.status == 403 and 'security token included in the request is expired' in e.message.lower())
 
@@ -402,17 +508,12 @@ def get_region(region):
     if not region:
         raise click.UsageError('Please specify the AWS region on the command line (--region) or in ~/.aws/config')
 
-    cf = boto.cloudformation.connect_to_region(region)
-    if not cf:
+    # only ask boto (which reads the credentials when connecting) for regions missing in our table
+    if region not in KNOWN_REGIONS and not get_connection('cloudformation', region):
         raise click.UsageError('Invalid region "{}"'.format(region))
     return region
 
 
-def check_credentials(region):
-    iam = boto.iam.connect_to_region(region)
-    return iam.get_account_alias()
-
-
 def get_stack_refs(refs: list):
     '''
     >>> get_stack_refs(['foobar-stack'])
@@ -453,28 +554,28 @@ def get_stack_refs(refs: list):
 @watch_option
 @watchrefresh_option
 @click.option('--all', is_flag=True, help='Show all stacks, including deleted ones')
+@stream_option
 @click.argument('stack_ref', nargs=-1)
-def list_stacks(region, stack_ref, all, output, w, watch):
+def list_stacks(region, stack_ref, all, output, w, watch, stream):
     '''List Cloud Formation stacks'''
+    check_stream_option(stream, output, w or watch)
     region = get_region(region)
-    check_credentials(region)
 
     stack_refs = get_stack_refs(stack_ref)
+    screen = Screen(w or watch, output)
 
-    for _ in watching(w, watch):
-        rows = []
+    def get_rows():
         for stack in get_stacks(stack_refs, region, all=all):
-            rows.append({'stack_name': stack.name,
-                         'version': stack.version,
-                         'status': stack.stack_status,
-                         'creation_time': calendar.timegm(stack.creation_time.timetuple()),
-                         'description': stack.template_description})
+            yield {'stack_name': stack.name,
+                   'version': stack.version,
+                   'status': stack.stack_status,
+                   'creation_time': calendar.timegm(stack.creation_time.timetuple()),
+                   'description': stack.template_description}
 
-        rows.sort(key=lambda x: (x['stack_name'], x['version']))
-
-        with OutputFormat(output):
-            print_table('stack_name version status creation_time description'.split(), rows,
-                        styles=STYLES, titles=TITLES)
+    for _ in watching(w, watch, screen):
+        with screen.draw(), OutputFormat(output):
+            print_rows('stack_name version status creation_time description'.split(), get_rows(), output, stream,
+                       key=lambda x: (x['stack_name'], x['version']), styles=STYLES, titles=TITLES)
 
 
 @cli.command()
@@ -485,19 +586,23 @@ def list_stacks(region, stack_ref, all, output, w, watch):
 @click.option('--disable-rollback', is_flag=True, help='Disable Cloud Formation rollback on failure')
 @click.option('--dry-run', is_flag=True, help='No-op mode: show what would be created')
 @click.option('-f', '--force', is_flag=True, help='Ignore failing validation checks')
-def create(definition, region, version, parameter, disable_rollback, dry_run, force):
+@no_cache_option
+@refresh_cache_option
+def create(definition, region, version, parameter, disable_rollback, dry_run, force, no_cache, refresh_cache):
     '''Create a new Cloud Formation stack from the given Senza definition file'''
+    import boto.exception
 
     input = definition
 
+    cache.configure(enabled=not no_cache, refresh=refresh_cache)
     region = get_region(region)
-    check_credentials(region)
     account_info = AccountArguments(region=region)
     args = parse_args(input, region, version, parameter, account_info)
 
     with Action('Generating Cloud Formation template..'):
         data = evaluate(input.copy(), args, account_info, force)
         cfjson = json.dumps(data, sort_keys=True, indent=4)
+    print_cache_stats()
 
     stack_name = "{0}-{1}".format(input["SenzaInfo"]["StackName"], version)
     if len(stack_name) > 128:
@@ -531,7 +636,7 @@ def create(definition, region, version, parameter, disable_rollback, dry_run, fo
 
     capabilities = get_required_capabilities(data)
 
-    cf = boto.cloudformation.connect_to_region(region)
+    cf = get_connection('cloudformation', region)
 
     with Action('Creating Cloud Formation stack {}..'.format(stack_name)) as act:
         try:
@@ -554,16 +659,19 @@ def create(definition, region, version, parameter, disable_rollback, dry_run, fo
 @region_option
 @json_output_option
 @click.option('-f', '--force', is_flag=True, help='Ignore failing validation checks')
-def print_cfjson(definition, region, version, parameter, output, force):
+@no_cache_option
+@refresh_cache_option
+def print_cfjson(definition, region, version, parameter, output, force, no_cache, refresh_cache):
     '''Print the generated Cloud Formation template'''
     input = definition
+    cache.configure(enabled=not no_cache, refresh=refresh_cache)
     region = get_region(region)
-    check_credentials(region)
     account_info = AccountArguments(region=region)
     args = parse_args(input, region, version, parameter, account_info)
     data = evaluate(input.copy(), args, account_info, force)
     cfjson = json.dumps(data, sort_keys=True, indent=4)
     print_json(cfjson, output)
+    print_cache_stats()
 
 
 @cli.command()
@@ -573,10 +681,10 @@ def print_cfjson(definition, region, version, parameter, output, force):
 @click.option('-f', '--force', is_flag=True, help='Allow deleting multiple stacks')
 def delete(stack_ref, region, dry_run, force):
     '''Delete a single Cloud Formation stack'''
+
     stack_refs = get_stack_refs(stack_ref)
     region = get_region(region)
-    check_credentials(region)
-    cf = boto.cloudformation.connect_to_region(region)
+    cf = get_connection('cloudformation', region)
 
     if not stack_refs:
         raise click.UsageError('Please specify at least one stack')
@@ -605,31 +713,115 @@ def format_resource_type(resource_type):
 @watch_option
 @watchrefresh_option
 @output_option
-def resources(stack_ref, region, w, watch, output):
+@stream_option
+def resources(stack_ref, region, w, watch, output, stream):
     '''Show all resources of a single Cloud Formation stack'''
+    check_stream_option(stream, output, w or watch)
+
     stack_refs = get_stack_refs(stack_ref)
     region = get_region(region)
-    check_credentials(region)
-    cf = boto.cloudformation.connect_to_region(region)
+    cf = get_connection('cloudformation', region)
 
-    for _ in watching(w, watch):
+    def get_resource_rows(stack):
         rows = []
+        for resource in cf.describe_stack_resources(stack.stack_name):
+            d = resource.__dict__
+            d['stack_name'] = stack.name
+            d['version'] = stack.version
+            d['resource_type'] = format_resource_type(d['resource_type'])
+            d['creation_time'] = calendar.timegm(resource.timestamp.timetuple())
+            rows.append(d)
+        return rows
+
+    # only keep the rows for the next refresh in watch mode
+    snapshot = Snapshot() if w or watch else None
+    screen = Screen(w or watch, output)
+
+    def get_rows():
         for stack in get_stacks(stack_refs, region):
-            resources = cf.describe_stack_resources(stack.stack_name)
-
-            for resource in resources:
-                d = resource.__dict__
-                d['stack_name'] = stack.name
-                d['version'] = stack.version
-                d['resource_type'] = format_resource_type(d['resource_type'])
-                d['creation_time'] = calendar.timegm(resource.timestamp.timetuple())
-                rows.append(d)
-
-        rows.sort(key=lambda x: (x['stack_name'], x['version'], x['logical_resource_id']))
-
-        with OutputFormat(output):
-            print_table('stack_name version logical_resource_id resource_type resource_status creation_time'.split(),
-                        rows, styles=STYLES, titles=TITLES)
+            fetch = functools.partial(get_resource_rows, stack)
+            # resources only change if the stack changes (or is in progress)
+            yield from snapshot.get(stack.stack_id, get_stack_indicator(stack), fetch) if snapshot else fetch()
+
+    for _ in watching(w, watch, screen):
+        with screen.draw(), OutputFormat(output):
+            print_rows('stack_name version logical_resource_id resource_type resource_status creation_time'.split(),
+                       get_rows(), output, stream,
+                       key=lambda x: (x['stack_name'], x['version'], x['logical_resource_id']),
+                       styles=STYLES, titles=TITLES)
+
+
+EVENT_COLUMNS = 'stack_name version resource_type logical_resource_id resource_status resource_status_reason event_time'
+
+
+def get_event_row(stack, event) -> dict:
+    d = event.__dict__
+    d['stack_name'] = stack.name
+    d['version'] = stack.version
+    d['resource_type'] = format_resource_type(d['resource_type'])
+    d['event_time'] = calendar.timegm(event.timestamp.timetuple())
+    return d
+
+
+def get_new_stack_events(cf, stack_id: str, last_event_id: str = None, max_pages: int = None) -> list:
+    '''Page through the stack events (newest first) until the last seen event, returns the new events oldest first'''
+    events = []
+    next_token = None
+    pages = 0
+    while True:
+        page = retry_throttled(cf.describe_stack_events)(stack_id, next_token)
+        pages += 1
+        for event in page:
+            if event.event_id == last_event_id:
+                return list(reversed(events))
+            events.append(event)
+        next_token = getattr(page, 'next_token', None)
+        if not next_token or (max_pages and pages >= max_pages):
+            return list(reversed(events))
+
+
+def print_event_line(row: dict):
+    '''Print an event as a single (colored) line of text'''
+    click.echo(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(row['event_time'])), nl=False)
+    click.echo(' {stack_name} {version} {resource_type} {logical_resource_id} '.format(**row), nl=False)
+    click.secho(row['resource_status'], nl=False, **STYLES.get(row['resource_status'], {}))
+    click.echo(' {}'.format(row.get('resource_status_reason') or ''))
+
+
+def tail_events(cf, stacks: list, output: str, interval: int):
+    '''Print new events as they occur (like "tail -f") until all stacks reached a final status
+
+    Only the events since the last seen event ID are fetched per stack and refresh,
+    the current stack status is taken from the stack's own events (no extra API calls).
+    '''
+    stack_status = {stack.stack_id: stack.stack_status for stack in stacks}
+    last_event_ids = {}
+    first = True
+    while True:
+        rows = []
+        for stack in stacks:
+            if not first and not stack_status[stack.stack_id].endswith('_IN_PROGRESS'):
+                continue
+            # show the latest events (first page) initially, like "tail" does
+            events = get_new_stack_events(cf, stack.stack_id, last_event_ids.get(stack.stack_id),
+                                          max_pages=1 if first else None)
+            for event in events:
+                last_event_ids[stack.stack_id] = event.event_id
+                if event.resource_type == 'AWS::CloudFormation::Stack' and \
+                        event.physical_resource_id == stack.stack_id:
+                    stack_status[stack.stack_id] = event.resource_status
+                rows.append(get_event_row(stack, event))
+        rows.sort(key=lambda x: x['event_time'])
+        if output in ('tsv', 'json'):
+            # same line format as "senza events --stream" (header only once, new events are appended)
+            print_row_lines(EVENT_COLUMNS.split(), rows, output, header=first)
+        else:
+            for row in rows:
+                print_event_line(row)
+        first = False
+        if not any(status.endswith('_IN_PROGRESS') for status in stack_status.values()):
+            break
+        time.sleep(interval)
 
 
 @cli.command()
@@ -638,32 +830,37 @@ def resources(stack_ref, region, w, watch, output):
 @watch_option
 @watchrefresh_option
 @output_option
-def events(stack_ref, region, w, watch, output):
+@click.option('--tail', is_flag=True,
+              help='Print new events as they occur (every 2 or --watch seconds) until all stacks are complete')
+@stream_option
+def events(stack_ref, region, w, watch, output, tail, stream):
     '''Show all Cloud Formation events for a single stack'''
+    check_stream_option(stream, output, w or watch)
+
     stack_refs = get_stack_refs(stack_ref)
     region = get_region(region)
-    check_credentials(region)
-    cf = boto.cloudformation.connect_to_region(region)
+    cf = get_connection('cloudformation', region)
 
-    for _ in watching(w, watch):
-        rows = []
-        for stack in get_stacks(stack_refs, region):
-            events = cf.describe_stack_events(stack.stack_name)
+    if tail:
+        tail_events(cf, list(get_stacks(stack_refs, region)), output, watch or 2)
+        return
 
-            for event in events:
-                d = event.__dict__
-                d['stack_name'] = stack.name
-                d['version'] = stack.version
-                d['resource_type'] = format_resource_type(d['resource_type'])
-                d['event_time'] = calendar.timegm(event.timestamp.timetuple())
-                rows.append(d)
+    def get_event_rows(stack):
+        return [get_event_row(stack, event) for event in cf.describe_stack_events(stack.stack_name)]
 
-        rows.sort(key=lambda x: x['event_time'])
+    snapshot = Snapshot() if w or watch else None
+    screen = Screen(w or watch, output)
 
-        with OutputFormat(output):
-            print_table(('stack_name version resource_type logical_resource_id ' +
-                        'resource_status resource_status_reason event_time').split(),
-                        rows, styles=STYLES, titles=TITLES, max_column_widths=MAX_COLUMN_WIDTHS)
+    def get_rows():
+        for stack in get_stacks(stack_refs, region):
+            fetch = functools.partial(get_event_rows, stack)
+            # no new events without a change of the stack status (or while in progress)
+            yield from snapshot.get(stack.stack_id, get_stack_indicator(stack), fetch) if snapshot else fetch()
+
+    for _ in watching(w, watch, screen):
+        with screen.draw(), OutputFormat(output):
+            print_rows(EVENT_COLUMNS.split(), get_rows(), output, stream, key=lambda x: x['event_time'],
+                       styles=STYLES, titles=TITLES, max_column_widths=MAX_COLUMN_WIDTHS)
 
 
 def get_template_description(template: str):
@@ -680,7 +877,6 @@ def get_template_description(template: str):
 def init(definition_file, region, template, user_variable):
     '''Initialize a new Senza definition'''
     region = get_region(region)
-    check_credentials(region)
 
     templates = []
     for mod in os.listdir(os.path.join(os.path.dirname(__file__), 'templates')):
@@ -703,34 +899,138 @@ def init(definition_file, region, template, user_variable):
 
 
 def get_instance_health(elb, stack_name: str) -> dict:
+    import boto.exception
     instance_health = {}
     try:
-        instance_states = elb.describe_instance_health(stack_name)
+        instance_states = retry_throttled(elb.describe_instance_health)(stack_name)
         for istate in instance_states:
             instance_health[istate.instance_id] = camel_case_to_underscore(istate.state).upper()
     except boto.exception.BotoServerError as e:
         # ignore non existing ELBs
         # ignore ValidationError "LoadBalancer name cannot be longer than 32 characters"
-        # ignore rate limit exceeded errors
+        # ignore rate limit exceeded errors (after retrying with backoff)
         if e.code not in ('LoadBalancerNotFound', 'ValidationError', 'Throttling'):
             raise
     return instance_health
 
 
-def get_instance_user_data(instance) -> dict:
+def is_in_service(instance_health: dict) -> bool:
+    '''
+    >>> is_in_service({'i-1': 'IN_SERVICE', 'i-2': 'OUT_OF_SERVICE'})
+    False
+    '''
+    return all(state == 'IN_SERVICE' for state in instance_health.values())
+
+
+def get_instances_indicator(instances: list) -> frozenset:
+    '''Change indicator of a group of EC2 instances (IDs, states and state transition reasons incl. timestamp)'''
+    return frozenset((instance.id, instance.state, getattr(instance, 'reason', None)) for instance in instances)
+
+
+def get_instance_health_by_stack(elb, instances: list, max_workers: int = DEFAULT_MAX_WORKERS,
+                                 snapshot: Snapshot = None) -> dict:
+    '''Fetch the ELB instance health once per stack of the given instances (concurrently), keyed by CF stack name
+
+    Health from the previous refresh (snapshot) is reused for stacks whose instances did not change
+    and are all "InService".
+    '''
+    instances_by_stack = collections.defaultdict(list)
+    for instance in instances:
+        stack_name = instance.tags.get('aws:cloudformation:stack-name')
+        if stack_name:
+            instances_by_stack[stack_name].append(instance)
+    snapshot = snapshot or Snapshot()
+
+    def fetch(stack_name):
+        return snapshot.get(('instance-health', stack_name), get_instances_indicator(instances_by_stack[stack_name]),
+                            functools.partial(get_instance_health, elb, stack_name), settled=is_in_service)
+
+    stack_names = sorted(instances_by_stack)
+    return dict(zip(stack_names, parallel_map(fetch, stack_names, max_workers)))
+
+
+# maximum number of names per DescribeAutoScalingGroups/DescribeLaunchConfigurations call
+AUTO_SCALING_MAX_NAMES = 50
+
+# top level "source" key of the Taupage YAML, e.g. 'source: "pierone.example.org/foo/bar:1.0"'
+# (plain or quoted scalar, values starting with YAML indicators like ">" or "&" are left to the YAML parser)
+TAUPAGE_SOURCE_PATTERN = re.compile(r'''^source:[ \t]*(["']?)([^\s"'#>|&*!%@`{\[][^\s"'#]*)\1[ \t]*(#.*)?$''',
+                                    re.MULTILINE)
+
+
+def get_instance_user_data(instance) -> bytes:
     try:
         attrs = instance.get_attribute('userData')
         data_b64 = attrs['userData']
-        data_yaml = base64.b64decode(data_b64)
-        data_dict = yaml.load(data_yaml)
-        return data_dict
+        return base64.b64decode(data_b64)
     except Exception as e:  # there's just too many ways this can fail, catch 'em all
         sys.stderr.write('Failed to query instance user data: {}\n'.format(e))
-    return {}
+    return b''
+
+
+def get_user_data_by_instance_id(autoscale, instances: list, max_workers: int = DEFAULT_MAX_WORKERS,
+                                 user_data_cache: dict = None) -> dict:
+    '''Get the user data of the given EC2 instances with as few API calls as possible
+
+    All instances of an auto scaling group share the user data of their launch configuration,
+    it is read with a few DescribeAutoScalingGroups and DescribeLaunchConfigurations calls (up to 50 names each).
+    The user data of all other instances is fetched concurrently (one DescribeInstanceAttribute call each).
+    Neither launch configurations nor the user data of running instances change,
+    the user_data_cache can be reused for later calls (e.g. in watch mode).
+    '''
+    user_data = {} if user_data_cache is None else user_data_cache
+    missing = [instance for instance in instances if ('instance', instance.id) not in user_data]
+
+    launch_config_by_instance_id = {}
+    group_names = sorted(set(instance.tags.get('aws:autoscaling:groupName') for instance in missing) - {None})
+    for i in range(0, len(group_names), AUTO_SCALING_MAX_NAMES):
+        for group in retry_throttled(autoscale.get_all_groups)(names=group_names[i:i + AUTO_SCALING_MAX_NAMES]):
+            for group_instance in group.instances or []:
+                launch_config_by_instance_id[group_instance.instance_id] = group_instance.launch_config_name
+
+    launch_config_names = sorted(set(launch_config_by_instance_id.values()) - {None} -
+                                 set(name for key, name in user_data if key == 'launch-configuration'))
+    for i in range(0, len(launch_config_names), AUTO_SCALING_MAX_NAMES):
+        names = launch_config_names[i:i + AUTO_SCALING_MAX_NAMES]
+        for launch_config in retry_throttled(autoscale.get_all_launch_configurations)(names=names):
+            user_data[('launch-configuration', launch_config.name)] = launch_config.user_data
+
+    single = []
+    for instance in missing:
+        key = ('launch-configuration', launch_config_by_instance_id.get(instance.id))
+        if key in user_data:
+            user_data[('instance', instance.id)] = user_data[key]
+        else:
+            # not part of an auto scaling group (anymore) or launch configuration was deleted
+            single.append(instance)
+    for instance, data in zip(single, parallel_map(get_instance_user_data, single, max_workers)):
+        user_data[('instance', instance.id)] = data
+
+    return {instance.id: user_data[('instance', instance.id)] for instance in instances}
 
 
-def get_instance_docker_image_source(instance) -> str:
-    return get_instance_user_data(instance).get('source', '')
+def get_docker_image_source(user_data) -> str:
+    '''Get the docker image "source" from the Taupage user data (only parses the YAML for unusual formatting)
+
+    >>> get_docker_image_source(b'#taupage-ami-config\\nsource: "foo/bar:1.0" # app\\nports:\\n  80: 80')
+    'foo/bar:1.0'
+
+    >>> get_docker_image_source('source: >-\\n  foo/bar:1.0\\n')
+    'foo/bar:1.0'
+
+    >>> get_docker_image_source(b'')
+    ''
+    '''
+    if isinstance(user_data, bytes):
+        user_data = user_data.decode('utf-8', errors='replace')
+    match = TAUPAGE_SOURCE_PATTERN.search(user_data or '')
+    if match:
+        return match.group(2)
+    try:
+        return (yaml.safe_load(user_data) or {}).get('source', '')
+    except Exception as e:
+        sys.stderr.write('Failed to parse instance user data: {}\n'.format(e))
+    return ''
 
 
 @cli.command()
@@ -742,14 +1042,18 @@ def get_instance_docker_image_source(instance) -> str:
 @output_option
 @watch_option
 @watchrefresh_option
-def instances(stack_ref, all, terminated, docker_image, region, output, w, watch):
+@parallelism_option
+@stream_option
+def instances(stack_ref, all, terminated, docker_image, region, output, w, watch, parallelism, stream):
     '''List the stack's EC2 instances'''
+    check_stream_option(stream, output, w or watch)
+
     stack_refs = get_stack_refs(stack_ref)
     region = get_region(region)
-    check_credentials(region)
 
-    conn = boto.ec2.connect_to_region(region)
-    elb = boto.ec2.elb.connect_to_region(region)
+    conn = get_connection('ec2', region)
+    elb = get_connection('ec2.elb', region)
+    autoscale = get_connection('ec2.autoscale', region) if docker_image else None
 
     if all:
         filters = None
@@ -759,36 +1063,117 @@ def instances(stack_ref, all, terminated, docker_image, region, output, w, watch
 
     opt_docker_column = ' docker_source' if docker_image else ''
 
-    for _ in watching(w, watch):
-        rows = []
-
-        for instance in conn.get_only_instances(filters=filters):
+    snapshot = Snapshot()
+    screen = Screen(w or watch, output)
+    user_data_cache = {}
+
+    def get_rows():
+        instances = [instance for instance in conn.get_only_instances(filters=filters)
+                     if (not stack_refs or
+                         matches_any(instance.tags.get('aws:cloudformation:stack-name'), stack_refs)) and
+                     (instance.state.upper() != 'TERMINATED' or terminated)]
+        # one DescribeInstanceHealth call per stack (ELB), not per instance
+        health_by_stack = get_instance_health_by_stack(elb, instances, parallelism, snapshot)
+        if docker_image:
+            user_data_by_instance_id = get_user_data_by_instance_id(autoscale, instances, parallelism,
+                                                                    user_data_cache)
+
+        for instance in instances:
             cf_stack_name = instance.tags.get('aws:cloudformation:stack-name')
             stack_name = instance.tags.get('StackName')
             stack_version = instance.tags.get('StackVersion')
-            if not stack_refs or matches_any(cf_stack_name, stack_refs):
-                instance_health = get_instance_health(elb, cf_stack_name)
-                if instance.state.upper() != 'TERMINATED' or terminated:
+            instance_health = health_by_stack.get(cf_stack_name, {})
+            if docker_image:
+                docker_source = get_docker_image_source(user_data_by_instance_id[instance.id])
+            else:
+                docker_source = ''
+            yield {'stack_name': stack_name or '',
+                   'version': stack_version or '',
+                   'resource_id': instance.tags.get('aws:cloudformation:logical-id'),
+                   'instance_id': instance.id,
+                   'public_ip': instance.ip_address,
+                   'private_ip': instance.private_ip_address,
+                   'state': instance.state.upper().replace('-', '_'),
+                   'lb_status': instance_health.get(instance.id),
+                   'docker_source': docker_source,
+                   'launch_time': parse_time(instance.launch_time)}
+
+    for _ in watching(w, watch, screen):
+        with screen.draw(), OutputFormat(output):
+            print_rows(('stack_name version resource_id instance_id public_ip ' +
+                        'private_ip state lb_status{} launch_time'.format(opt_docker_column)).split(),
+                       get_rows(), output, stream, key=lambda r: (r['stack_name'], r['version'], r['instance_id']),
+                       styles=STYLES, titles=TITLES)
+
+
+def get_instances_by_stack_id(conn) -> dict:
+    '''Fetch all stack instances of the region with a single DescribeInstances call, indexed by CF stack ID'''
+    instances_by_stack_id = collections.defaultdict(list)
+    # DescribeInstances without MaxResults returns the complete result set in one response
+    for instance in retry_throttled(conn.get_only_instances)(filters={'tag-key': 'aws:cloudformation:stack-id'}):
+        instances_by_stack_id[instance.tags.get('aws:cloudformation:stack-id')].append(instance)
+    return instances_by_stack_id
+
+
+def get_stack_details(stack, elb, cf) -> dict:
+    '''Get the load balancer health of the stack's instances and the stack's resources'''
+    return {'instance_health': get_instance_health(elb, stack.stack_name),
+            'resources': retry_throttled(cf.describe_stack_resources)(stack.stack_id)}
+
+
+def is_stack_details_settled(details: dict) -> bool:
+    '''
+    >>> is_stack_details_settled({'instance_health': {'i-1': 'IN_SERVICE'}})
+    True
 
-                    docker_source = get_instance_docker_image_source(instance) if docker_image else ''
+    >>> is_stack_details_settled({'instance_health': {'i-1': 'IN_SERVICE', 'i-2': 'OUT_OF_SERVICE'}})
+    False
+    '''
+    return all(state == 'IN_SERVICE' for state in details['instance_health'].values())
 
-                    rows.append({'stack_name': stack_name or '',
-                                 'version': stack_version or '',
-                                 'resource_id': instance.tags.get('aws:cloudformation:logical-id'),
-                                 'instance_id': instance.id,
-                                 'public_ip': instance.ip_address,
-                                 'private_ip': instance.private_ip_address,
-                                 'state': instance.state.upper().replace('-', '_'),
-                                 'lb_status': instance_health.get(instance.id),
-                                 'docker_source': docker_source,
-                                 'launch_time': parse_time(instance.launch_time)})
 
-        rows.sort(key=lambda r: (r['stack_name'], r['version'], r['instance_id']))
+def get_stack_status(stack, instances_by_stack_id: dict, details: dict, record_index) -> dict:
+    '''Collect the status row of a single stack (called concurrently for all stacks)
 
-        with OutputFormat(output):
-            print_table(('stack_name version resource_id instance_id public_ip ' +
-                         'private_ip state lb_status{} launch_time'.format(opt_docker_column)).split(),
-                        rows, styles=STYLES, titles=TITLES)
+    The traffic (Route53 weights) and HTTP status are checked on every call, they change independently of the stack.
+    '''
+    import requests
+
+    instance_health = details['instance_health']
+
+    main_dns_resolves = False
+    http_status = None
+    for res in details['resources']:
+        if res.resource_type == 'AWS::Route53::RecordSet':
+            name = res.physical_resource_id
+            if not name:
+                # physical resource ID will be empty during stack creation
+                continue
+            if 'version' in res.logical_resource_id.lower():
+                try:
+                    requests.get('https://{}/'.format(name), timeout=2)
+                    http_status = 'OK'
+                except:
+                    http_status = 'ERROR'
+            else:
+                # main domain: one of the (weighted) records with traffic points to the stack's load balancer
+                for record in record_index.find(name, 'CNAME'):
+                    if record.weight is not None and not int(record.weight):
+                        continue
+                    if any(value.startswith('{}-'.format(stack.stack_name)) for value in record.resource_records):
+                        main_dns_resolves = True
+
+    instances = instances_by_stack_id.get(stack.stack_id, [])
+    return {'stack_name': stack.name,
+            'version': stack.version,
+            'status': stack.stack_status,
+            'total_instances': len(instances),
+            'running_instances': len([i for i in instances if i.state == 'running']),
+            'healthy_instances': len([i for i in instance_health.values() if i == 'IN_SERVICE']),
+            'lb_status': ','.join(set(instance_health.values())),
+            'main_dns': main_dns_resolves,
+            'http_status': http_status
+            }
 
 
 @cli.command()
@@ -797,58 +1182,43 @@ def instances(stack_ref, all, terminated, docker_image, region, output, w, watch
 @output_option
 @watch_option
 @watchrefresh_option
-def status(stack_ref, region, output, w, watch):
+@parallelism_option
+def status(stack_ref, region, output, w, watch, parallelism):
     '''Show stack status information'''
+
     stack_refs = get_stack_refs(stack_ref)
     region = get_region(region)
-    check_credentials(region)
 
-    conn = boto.ec2.connect_to_region(region)
-    elb = boto.ec2.elb.connect_to_region(region)
-    cf = boto.cloudformation.connect_to_region(region)
+    conn = get_connection('ec2', region)
+    elb = get_connection('ec2.elb', region)
+    cf = get_connection('cloudformation', region)
+    record_index = get_record_index(region)
 
-    for _ in watching(w, watch):
-        rows = []
-        for stack in sorted(get_stacks(stack_refs, region)):
-            instance_health = get_instance_health(elb, stack.stack_name)
-
-            main_dns_resolves = False
-            http_status = None
-            resources = cf.describe_stack_resources(stack.stack_id)
-            for res in resources:
-                if res.resource_type == 'AWS::Route53::RecordSet':
-                    name = res.physical_resource_id
-                    if not name:
-                        # physical resource ID will be empty during stack creation
-                        continue
-                    if 'version' in res.logical_resource_id.lower():
-                        try:
-                            requests.get('https://{}/'.format(name), timeout=2)
-                            http_status = 'OK'
-                        except:
-                            http_status = 'ERROR'
-                    else:
-                        try:
-                            answers = dns.resolver.query(name, 'CNAME')
-                        except:
-                            answers = []
-                        for answer in answers:
-                            if answer.target.to_text().startswith('{}-'.format(stack.stack_name)):
-                                main_dns_resolves = True
-
-            instances = conn.get_only_instances(filters={'tag:aws:cloudformation:stack-id': stack.stack_id})
-            rows.append({'stack_name': stack.name,
-                         'version': stack.version,
-                         'status': stack.stack_status,
-                         'total_instances': len(instances),
-                         'running_instances': len([i for i in instances if i.state == 'running']),
-                         'healthy_instances': len([i for i in instance_health.values() if i == 'IN_SERVICE']),
-                         'lb_status': ','.join(set(instance_health.values())),
-                         'main_dns': main_dns_resolves,
-                         'http_status': http_status
-                         })
+    snapshot = Snapshot()
+    screen = Screen(w or watch, output)
 
-        with OutputFormat(output):
+    def get_row(stack, instances_by_stack_id):
+        stack_indicator = get_stack_indicator(stack)
+        if stack_indicator is None:
+            indicator = None
+        else:
+            indicator = (stack_indicator, get_instances_indicator(instances_by_stack_id.get(stack.stack_id, [])))
+        # resources and load balancer health of healthy stacks are only fetched again if the stack
+        # or its instances changed, the traffic and HTTP status are checked on every refresh
+        details = snapshot.get(stack.stack_id, indicator, functools.partial(get_stack_details, stack, elb, cf),
+                               settled=is_stack_details_settled)
+        return get_stack_status(stack, instances_by_stack_id, details, record_index)
+
+    for refresh in watching(w, watch, screen):
+        if refresh:
+            record_index.refresh()
+        # one account-wide instance snapshot per refresh, shared by all stack rows
+        instances_by_stack_id = get_instances_by_stack_id(conn)
+        # fan out the (slow) per-stack API calls and probes, rows keep the sorted stack order
+        rows = parallel_map(lambda stack: get_row(stack, instances_by_stack_id),
+                            sorted(get_stacks(stack_refs, region)), parallelism)
+
+        with screen.draw(), OutputFormat(output):
             print_table(('stack_name version status total_instances running_instances healthy_instances ' +
                          'lb_status http_status main_dns').split(), rows, styles=STYLES, titles=TITLES)
 
@@ -861,32 +1231,32 @@ def status(stack_ref, region, output, w, watch):
 @watchrefresh_option
 def domains(stack_ref, region, output, w, watch):
     '''List the stack's Route53 domains'''
+
     stack_refs = get_stack_refs(stack_ref)
     region = get_region(region)
-    check_credentials(region)
 
-    cf = boto.cloudformation.connect_to_region(region)
-    route53 = boto.route53.connect_to_region(region)
+    cf = get_connection('cloudformation', region)
+    record_index = get_record_index(region)
 
-    records_by_name = {}
+    snapshot = Snapshot()
+    screen = Screen(w or watch, output)
 
-    for _ in watching(w, watch):
+    for refresh in watching(w, watch, screen):
+        if refresh:
+            # only reads the records of changed hosted zones again
+            record_index.refresh()
         rows = []
         for stack in get_stacks(stack_refs, region):
             if stack.stack_status == 'ROLLBACK_COMPLETE':
                 # performance optimization: do not call EC2 API for "dead" stacks
                 continue
 
-            resources = cf.describe_stack_resources(stack.stack_id)
+            resources = snapshot.get(stack.stack_id, get_stack_indicator(stack),
+                                     functools.partial(cf.describe_stack_resources, stack.stack_id))
             for res in resources:
                 if res.resource_type == 'AWS::Route53::RecordSet':
-                    name = res.physical_resource_id
-                    if name not in records_by_name:
-                        zone_name = name.split('.', 1)[1]
-                        zone = route53.get_zone(zone_name)
-                        for rec in zone.get_records():
-                            records_by_name[(rec.name.rstrip('.'), rec.identifier)] = rec
-                    record = records_by_name.get((name, stack.stack_name)) or records_by_name.get((name, None))
+                    records = {rec.identifier: rec for rec in record_index.find(res.physical_resource_id)}
+                    record = records.get(stack.stack_name) or records.get(None)
                     rows.append({'stack_name': stack.name,
                                  'version': stack.version,
                                  'resource_id': res.logical_resource_id,
@@ -896,29 +1266,106 @@ def domains(stack_ref, region, output, w, watch):
                                  'value': ','.join(record.resource_records) if record else None,
                                  'create_time': calendar.timegm(res.timestamp.timetuple())})
 
-        with OutputFormat(output):
+        with screen.draw(), OutputFormat(output):
             print_table('stack_name version resource_id domain weight type value create_time'.split(),
                         rows, styles=STYLES, titles=TITLES)
 
 
 @cli.command()
-@click.argument('stack_name')
+@click.argument('stack_name', required=False)
 @click.argument('stack_version', required=False)
 @click.argument('percentage', type=FloatRange(0, 100, clamp=True), required=False)
 @region_option
 @output_option
-def traffic(stack_name, stack_version, percentage, region, output):
+@click.option('--batch', type=click.File('r'), metavar='FILE',
+              help='Change the traffic of all stack versions listed in the YAML file (stack_name, stack_version '
+                   'and percentage per entry) with one Route53 change batch per hosted zone')
+@click.option('--steps', callback=validate_steps, metavar='PERCENTAGES',
+              help='Shift the traffic gradually to the stack version, e.g. "1,5,25,50,100" (resumes if interrupted)')
+@click.option('--interval', callback=validate_interval, metavar='DURATION',
+              help='Time to wait between the --steps (default: 5m)')
+@click.option('--min-healthy', type=click.IntRange(0), metavar='N',
+              help='Stop the --steps ramp unless at least N instances of the stack version are in service')
+@click.option('--wait', is_flag=True,
+              help='Wait until Route53 propagated the changes (INSYNC), print (only) the status of every change')
+@click.option('--wait-timeout', default='10m', callback=validate_interval, metavar='DURATION',
+              help='Fail if the changes are not in sync after this time (default: 10m)')
+@click.option('--legacy-weights', is_flag=True,
+              help='Calculate the new weights like older senza versions (instead of exact apportionment)')
+@click.option('--simulate', type=click.File('r'), metavar='FILE',
+              help='Only print the Route53 changes for the hosted zone and stack versions recorded in the JSON file '
+                   '(HostedZone, ResourceRecordSets and StackVersions), without calling AWS')
+def traffic(stack_name, stack_version, percentage, region, output, batch, steps, interval, min_healthy, wait,
+            wait_timeout, legacy_weights, simulate):
     '''Route traffic to a specific stack (weighted DNS record)'''
+    from .traffic import change_version_traffic, print_version_traffic, change_traffic_batch, load_traffic_batch, \
+        ramp_version_traffic, check_in_sync, simulate_traffic, progress_to_stderr
+
+    check_ramp_options(steps, interval, min_healthy, batch)
+    if simulate:
+        if steps or wait:
+            raise click.UsageError('--simulate cannot be used with --steps or --wait')
+        if batch:
+            if stack_name:
+                raise click.UsageError('Either use --batch or pass the stack name, not both')
+            entries = load_traffic_batch(batch)
+        elif stack_name and stack_version and percentage is not None:
+            entries = [(get_stack_refs([stack_name, stack_version])[0], percentage)]
+        else:
+            raise click.UsageError('--simulate requires the stack name, version and percentage (or --batch)')
+        with OutputFormat(output):
+            simulate_traffic(entries, simulate, legacy_weights)
+        return
+    if batch:
+        if stack_name:
+            raise click.UsageError('Either use --batch or pass the stack name, not both')
+        entries = load_traffic_batch(batch)
+        region = get_region(region)
+        with OutputFormat(output):
+            # with --wait, only the status of the changes is printed to stdout
+            with progress_to_stderr(wait):
+                change_ids = change_traffic_batch(entries, region, legacy_weights)
+            if wait and change_ids:
+                check_in_sync(region, change_ids, wait_timeout, show=True)
+        return
+    if not stack_name:
+        raise click.UsageError('Missing argument "stack_name"')
+
     stack_refs = get_stack_refs([stack_name, stack_version])
     region = get_region(region)
-    check_credentials(region)
+
+    if steps:
+        if not stack_version or percentage is not None:
+            raise click.UsageError('--steps requires the stack version (and no percentage)')
+        if interval is None:
+            interval = DEFAULT_RAMP_INTERVAL
+
+        def check_health(version):
+            elb = get_connection('ec2.elb', region)
+            instance_health = get_instance_health(elb, version.identifier)
+            in_service = sum(1 for state in instance_health.values() if state == 'IN_SERVICE')
+            if in_service < min_healthy:
+                raise click.ClickException('Only {} of {} instances of {} are in service (--min-healthy {}), '
+                                           'stopping. Run the command again to resume.'.format(
+                                               in_service, len(instance_health), version.identifier, min_healthy))
+
+        with OutputFormat(output):
+            ramp_version_traffic(stack_refs[0], steps, interval, region,
+                                 check_health if min_healthy is not None else None,
+                                 wait_timeout if wait else None, legacy_weights)
+        return
 
     with OutputFormat(output):
-        for ref in stack_refs:
-            if percentage is None:
-                print_version_traffic(ref, region)
-            else:
-                change_version_traffic(ref, percentage, region)
+        change_ids = []
+        # with --wait, only the status of the changes is printed to stdout
+        with progress_to_stderr(wait and percentage is not None):
+            for ref in stack_refs:
+                if percentage is None:
+                    print_version_traffic(ref, region)
+                else:
+                    change_ids.extend(change_version_traffic(ref, percentage, region, legacy_weights))
+        if wait and change_ids:
+            check_in_sync(region, change_ids, wait_timeout, show=True)
 
 
 @cli.command()
@@ -928,57 +1375,64 @@ def traffic(stack_name, stack_version, percentage, region, output):
 @click.option('--show-instances', is_flag=True, help='Show EC2 instance IDs')
 @region_option
 @output_option
-def images(stack_ref, region, output, hide_older_than, show_instances):
+@stream_option
+def images(stack_ref, region, output, hide_older_than, show_instances, stream):
     '''Show all used AMIs and available Taupage AMIs'''
+    check_stream_option(stream, output, False)
+
     stack_refs = get_stack_refs(stack_ref)
     region = get_region(region)
-    check_credentials(region)
 
-    conn = boto.ec2.connect_to_region(region)
+    conn = get_connection('ec2', region)
+
+    # do not count TERMINATED EC2 instances
+    filters = {'instance-state-name': ['pending', 'running', 'shutting-down', 'stopping', 'stopped']}
+    if stack_refs:
+        # only fetch the instances of the requested stacks, not all instances of the account
+        filters['tag:aws:cloudformation:stack-name'] = get_stack_name_filter(stack_refs)
 
     instances_by_image = collections.defaultdict(list)
-    for inst in conn.get_only_instances():
+    for inst in retry_throttled(conn.get_only_instances)(filters=filters):
         if inst.state == 'terminated':
-            # do not count TERMINATED EC2 instances
             continue
         stack_name = inst.tags.get('aws:cloudformation:stack-name')
         if not stack_refs or matches_any(stack_name, stack_refs):
             instances_by_image[inst.image_id].append(inst)
 
     images = {}
-    for image in conn.get_all_images(filters={'image-id': list(instances_by_image.keys())}):
-        images[image.id] = image
     if not stack_refs:
-        filters = {'name': '*Taupage-*',
-                   'state': 'available'}
-        for image in conn.get_all_images(filters=filters):
-            images[image.id] = image
-    rows = []
+        for image in get_taupage_images(region):
+            images[image['id']] = image
+    missing_image_ids = [image_id for image_id in instances_by_image if image_id not in images]
+    for image in get_images(region, missing_image_ids):
+        images[image['id']] = image
     cutoff = datetime.datetime.now() - datetime.timedelta(days=hide_older_than)
-    for image in images.values():
-        row = image.__dict__
-        creation_time = parse_time(image.creationDate)
-        row['creation_time'] = creation_time
-        row['instances'] = ', '.join(sorted(i.id for i in instances_by_image[image.id]))
-        row['total_instances'] = len(instances_by_image[image.id])
-        stacks = set()
-        for instance in instances_by_image[image.id]:
-            stack_name = instance.tags.get('aws:cloudformation:stack-name')
-            # EC2 instance might not be part of a CF stack
-            if stack_name:
-                stacks.add(stack_name)
-        row['stacks'] = ', '.join(sorted(stacks))
 
-        #
-        if creation_time > cutoff.timestamp() or row['total_instances']:
-            rows.append(row)
+    def get_rows():
+        for image in images.values():
+            row = dict(image)
+            creation_time = parse_time(image['creation_date'])
+            row['creation_time'] = creation_time
+            row['instances'] = ', '.join(sorted(i.id for i in instances_by_image[image['id']]))
+            row['total_instances'] = len(instances_by_image[image['id']])
+            stacks = set()
+            for instance in instances_by_image[image['id']]:
+                stack_name = instance.tags.get('aws:cloudformation:stack-name')
+                # EC2 instance might not be part of a CF stack
+                if stack_name:
+                    stacks.add(stack_name)
+            row['stacks'] = ', '.join(sorted(stacks))
+
+            #
+            if creation_time > cutoff.timestamp() or row['total_instances']:
+                yield row
 
-    rows.sort(key=lambda x: x.get('name'))
     with OutputFormat(output):
         cols = 'id name owner_id description stacks total_instances creation_time'
         if show_instances:
             cols = cols.replace('total_instances', 'instances')
-        print_table(cols.split(), rows, titles=TITLES, max_column_widths=MAX_COLUMN_WIDTHS)
+        print_rows(cols.split(), get_rows(), output, stream, key=lambda x: x.get('name'),
+                   titles=TITLES, max_column_widths=MAX_COLUMN_WIDTHS)
 
 
 def is_ip_address(x: str):
@@ -1031,6 +1485,44 @@ def print_console(line: str):
     click.secho(line, **style)
 
 
+def get_console_lines(conn, instance_id: str) -> list:
+    output = retry_throttled(conn.get_console_output)(instance_id)
+    if not output.output:
+        return []
+    return output.output.decode('utf-8', errors='replace').split('\n')
+
+
+def get_new_console_lines(previous: list, current: list) -> list:
+    '''Get the lines of the current console output which were not part of the previous output
+
+    The console output is a sliding window over the latest output, i.e. old lines may have been dropped.
+
+    >>> get_new_console_lines(['a', 'b'], ['a', 'b', 'c'])
+    ['c']
+
+    >>> get_new_console_lines(['a', 'b', 'c'], ['b', 'c', 'd', 'e'])
+    ['d', 'e']
+
+    >>> get_new_console_lines(['a', 'b'], ['a', 'b'])
+    []
+
+    >>> get_new_console_lines(['a'], ['x', 'y'])
+    ['x', 'y']
+
+    >>> get_new_console_lines(['a'], [])
+    []
+    '''
+    if not current:
+        return []
+    if current[:len(previous)] == previous:
+        return current[len(previous):]
+    # find the largest overlap of the previous output's end and the current output's start
+    for i, line in enumerate(previous):
+        if line == current[0] and previous[i:] == current[:len(previous) - i]:
+            return current[len(previous) - i:]
+    return current
+
+
 @cli.command()
 @click.argument('instance_or_stack_ref', nargs=-1)
 @click.option('-l', '--limit', help='Show last N lines of console output (default: 25)',
@@ -1038,7 +1530,8 @@ def print_console(line: str):
 @region_option
 @watch_option
 @watchrefresh_option
-def console(instance_or_stack_ref, limit, region, w, watch):
+@parallelism_option
+def console(instance_or_stack_ref, limit, region, w, watch, parallelism):
     '''Print EC2 instance console output.
 
     INSTANCE_OR_STACK_REF can be an instance ID, private IP address or stack name/version.'''
@@ -1055,21 +1548,38 @@ def console(instance_or_stack_ref, limit, region, w, watch):
         filters = {'tag-key': 'aws:cloudformation:stack-name'}
 
     region = get_region(region)
-    check_credentials(region)
-
-    conn = boto.ec2.connect_to_region(region)
 
-    for _ in watching(w, watch):
-
-        for instance in conn.get_only_instances(filters=filters):
-            cf_stack_name = instance.tags.get('aws:cloudformation:stack-name')
-            if not stack_refs or matches_any(cf_stack_name, stack_refs):
-                output = conn.get_console_output(instance.id)
-                click.secho('Showing last {} lines of {}..'.format(limit, instance.private_ip_address or instance.id),
-                            bold=True)
-                if output.output:
-                    for line in output.output.decode('utf-8', errors='replace').split('\n')[-limit:]:
-                        print_console(line)
+    conn = get_connection('ec2', region)
+
+    # complete console lines printed so far per instance ID (watch mode)
+    printed_lines = {}
+
+    # in watch mode the screen is not cleared, only new console lines are appended
+    for _ in watching(w, watch, clear=False):
+        instances = sorted((instance for instance in conn.get_only_instances(filters=filters)
+                            if not stack_refs or matches_any(instance.tags.get('aws:cloudformation:stack-name'),
+                                                             stack_refs)),
+                           key=lambda instance: instance.id)
+        # fetch concurrently, but print in instance order
+        outputs = parallel_map(functools.partial(get_console_lines, conn), [instance.id for instance in instances],
+                               parallelism)
+
+        for instance, lines in zip(instances, outputs):
+            name = instance.private_ip_address or instance.id
+            if w or watch:
+                # the last line might be incomplete, it is printed with a later refresh
+                lines = lines[:-1]
+            if instance.id in printed_lines:
+                new_lines = get_new_console_lines(printed_lines[instance.id], lines)
+                if new_lines:
+                    click.secho('New console output of {}..'.format(name), bold=True)
+            else:
+                new_lines = lines[-limit:]
+                click.secho('Showing last {} lines of {}..'.format(limit, name), bold=True)
+            if w or watch:
+                printed_lines[instance.id] = lines
+            for line in new_lines:
+                print_console(line)
 
 
 @cli.command()
@@ -1078,11 +1588,11 @@ def console(instance_or_stack_ref, limit, region, w, watch):
 @json_output_option
 def dump(stack_ref, region, output):
     '''Dump Cloud Formation template of existing stack'''
+
     stack_refs = get_stack_refs(stack_ref)
     region = get_region(region)
-    check_credentials(region)
 
-    conn = boto.cloudformation.connect_to_region(region)
+    conn = get_connection('cloudformation', region)
 
     for stack in get_stacks(stack_refs, region):
         result = conn.get_template(stack.stack_name)
@@ -1,6 +1,6 @@
 import importlib
 
-from senza.utils import camel_case_to_underscore, pystache_render
+from senza.utils import camel_case_to_underscore, pystache_render_structure
 
 
 def get_component(componenttype: str):
@@ -19,9 +19,10 @@ def get_component(componenttype: str):
 
 
 def evaluate_template(template, info, components, args, account_info):
+    '''Render all mustache templates in the given template string or (nested) definition structure'''
     data = {"SenzaInfo": info,
             "SenzaComponents": components,
             "Arguments": args,
             "AccountInfo": account_info}
-    result = pystache_render(template, data)
+    result = pystache_render_structure(template, data)
     return result
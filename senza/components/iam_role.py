@@ -1,13 +1,12 @@
-
-import boto.iam
 import json
 import urllib
 
+from senza.connections import get_connection
 from senza.utils import ensure_keys
 
 
 def get_merged_policies(roles: list, region: str):
-    iam = boto.iam.connect_to_region(region)
+    iam = get_connection('iam', region)
     policies = []
     for role in roles:
         policy_names = iam.list_role_policies(role)
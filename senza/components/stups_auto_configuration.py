@@ -1,13 +1,16 @@
-import boto.ec2
-import boto.vpc
-
+from senza import cache
 from senza.components.configuration import component_configuration
+from senza.connections import get_connection
 from senza.utils import ensure_keys
 
+# seconds to keep the AMI and subnet lookups in the on-disk cache
+TAUPAGE_IMAGE_CACHE_TTL = 3600
+SUBNET_CACHE_TTL = 86400
+
 
 def find_taupage_image(region: str):
     '''Find the latest Taupage AMI, first try private images, fallback to public'''
-    ec2_conn = boto.ec2.connect_to_region(region)
+    ec2_conn = get_connection('ec2', region)
     filters = {'name': '*Taupage-AMI-*',
                'is_public': 'false',
                'state': 'available',
@@ -25,26 +28,39 @@ def find_taupage_image(region: str):
     return most_recent_image
 
 
-def component_stups_auto_configuration(definition, configuration, args, info, force):
-    vpc_conn = boto.vpc.connect_to_region(args.region)
+def get_latest_taupage_image_id(region: str) -> str:
+    return cache.get_or_fetch(region, 'taupage-image', TAUPAGE_IMAGE_CACHE_TTL,
+                              lambda: find_taupage_image(region).id)
+
 
+def get_subnets(region: str) -> list:
+    '''Get ID, availability zone and name of all VPC subnets'''
+    def fetch():
+        vpc_conn = get_connection('vpc', region)
+        return [{'id': subnet.id,
+                 'availability_zone': subnet.availability_zone,
+                 'name': subnet.tags.get('Name', '')} for subnet in vpc_conn.get_all_subnets()]
+    return cache.get_or_fetch(region, 'subnets', SUBNET_CACHE_TTL, fetch)
+
+
+def component_stups_auto_configuration(definition, configuration, args, info, force):
     availability_zones = configuration.get('AvailabilityZones')
 
     server_subnets = []
     lb_subnets = []
     lb_internal_subnets = []
-    for subnet in vpc_conn.get_all_subnets():
-        name = subnet.tags.get('Name', '')
-        if availability_zones and subnet.availability_zone not in availability_zones:
+    for subnet in get_subnets(args.region):
+        name = subnet['name']
+        if availability_zones and subnet['availability_zone'] not in availability_zones:
             # skip subnet as it's not in one of the given AZs
             continue
         if 'dmz' in name:
-            lb_subnets.append(subnet.id)
+            lb_subnets.append(subnet['id'])
         elif 'internal' in name:
-            lb_internal_subnets.append(subnet.id)
-            server_subnets.append(subnet.id)
+            lb_internal_subnets.append(subnet['id'])
+            server_subnets.append(subnet['id'])
         else:
-            server_subnets.append(subnet.id)
+            server_subnets.append(subnet['id'])
 
     if not lb_subnets:
         # no DMZ subnets were found, just use the same set for both LB and instances
@@ -59,9 +75,8 @@ def component_stups_auto_configuration(definition, configuration, args, info, fo
     configuration = ensure_keys(configuration, "LoadBalancerInternalSubnets", args.region)
     configuration["LoadBalancerInternalSubnets"][args.region] = lb_internal_subnets
 
-    most_recent_image = find_taupage_image(args.region)
     configuration = ensure_keys(configuration, "Images", 'LatestTaupageImage', args.region)
-    configuration["Images"]['LatestTaupageImage'][args.region] = most_recent_image.id
+    configuration["Images"]['LatestTaupageImage'][args.region] = get_latest_taupage_image_id(args.region)
 
     component_configuration(definition, configuration, args, info, force)
 
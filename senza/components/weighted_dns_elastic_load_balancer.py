@@ -1,13 +1,17 @@
-
-import boto.route53
-
+from senza import cache
 from senza.components.elastic_load_balancer import component_elastic_load_balancer
+from senza.connections import get_connection
+
+# seconds to keep the list of hosted zones in the on-disk cache
+ZONE_CACHE_TTL = 3600
 
 
 def get_default_zone(region):
-    dns_conn = boto.route53.connect_to_region(region)
-    zones = dns_conn.get_zones()
-    domains = sorted([zone.name.rstrip('.') for zone in zones])
+    def fetch():
+        dns_conn = get_connection('route53', region)
+        zones = dns_conn.get_zones()
+        return sorted([zone.name.rstrip('.') for zone in zones])
+    domains = cache.get_or_fetch(region, 'hosted-zones', ZONE_CACHE_TTL, fetch)
     if not domains:
         raise Exception('No Route53 hosted zone found')
     return domains[0]
@@ -0,0 +1,86 @@
+'''
+Registry of AWS API connections (boto) and clients (boto3), one per service and region
+
+Sharing the connections keeps their HTTPS connections alive across all call sites
+(instead of a new TLS handshake for every "connect_to_region") and reads the credentials only once.
+Use "senza --debug .." to print the number of connections and TLS handshakes of a command.
+'''
+import collections
+import importlib
+import threading
+
+import click
+
+# connections/clients created and TLS handshakes done by this process (for debugging)
+stats = collections.Counter()
+
+_connections = {}
+_lock = threading.Lock()
+
+
+def get_connection(service: str, region: str):
+    '''Get the shared boto connection of the service (e.g. "ec2", "ec2.elb" or "cloudformation") in the region
+
+    Returns None for unknown regions (like boto's connect_to_region).
+    '''
+    key = ('boto', service, region)
+    with _lock:
+        if key not in _connections:
+            module = importlib.import_module('boto.{}'.format(service))
+            conn = module.connect_to_region(region)
+            if conn is None:
+                return None
+            stats['connections'] += 1
+            _connections[key] = conn
+        return _connections[key]
+
+
+def get_client(service: str, region: str = None):
+    '''Get the shared boto3 client of the service (in the region or the configured default region)'''
+    key = ('boto3-client', service, region)
+    with _lock:
+        if key not in _connections:
+            import boto3
+            kwargs = {'region_name': region} if region else {}
+            stats['connections'] += 1
+            _connections[key] = boto3.client(service, **kwargs)
+        return _connections[key]
+
+
+def get_resource(service: str, region: str = None):
+    '''Get the shared boto3 service resource (in the region or the configured default region)'''
+    key = ('boto3-resource', service, region)
+    with _lock:
+        if key not in _connections:
+            import boto3
+            kwargs = {'region_name': region} if region else {}
+            stats['connections'] += 1
+            _connections[key] = boto3.resource(service, **kwargs)
+        return _connections[key]
+
+
+def clear():
+    '''Forget all connections and statistics'''
+    with _lock:
+        _connections.clear()
+        stats.clear()
+
+
+def count_tls_handshakes():
+    '''Count the TLS handshakes of all (boto and boto3) HTTPS connections in stats'''
+    import ssl
+    wrap_socket = ssl.SSLContext.wrap_socket
+    if getattr(wrap_socket, 'counting', False):
+        return
+
+    def counting_wrap_socket(self, *args, **kwargs):
+        stats['tls_handshakes'] += 1
+        return wrap_socket(self, *args, **kwargs)
+    counting_wrap_socket.counting = True
+    ssl.SSLContext.wrap_socket = counting_wrap_socket
+
+
+def print_stats():
+    click.secho('AWS connections: {} created, {} TLS handshakes'.format(stats['connections'],
+                                                                        stats['tls_handshakes']),
+                fg='blue', err=True)
@@ -0,0 +1,176 @@
+'''
+Index of Route53 record sets shared by the commands working with DNS records (domains, traffic, status)
+
+Hosted zones are listed once, the record sets of a zone are read (page by page) when first needed
+and indexed by (name, type, set identifier). Refreshing (e.g. in watch mode) only reads the records
+of zones again whose ResourceRecordSetCount changed or which were loaded more than RECORDS_MAX_AGE seconds ago.
+'''
+import collections
+import threading
+import time
+
+from .aws import retry_throttled
+from .connections import get_connection
+
+# NOTE: boto is imported in the functions using it to keep the CLI startup time low
+
+# maximum page size of ListResourceRecordSets
+MAX_RECORDS_PER_PAGE = 300
+
+# seconds after which a zone's records are read again on refresh, even if its record set count did not change
+# (changing the weight of a record keeps the count)
+RECORDS_MAX_AGE = 60
+
+ZoneRecords = collections.namedtuple('ZoneRecords', 'record_set_count loaded records by_name')
+
+# seconds between polling the status of a change: doubled after every poll up to the maximum
+CHANGE_POLL_DELAY = 1
+CHANGE_POLL_MAX_DELAY = 30
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def normalize_name(name: str) -> str:
+    '''
+    >>> normalize_name('MyApp.Example.org.')
+    'myapp.example.org'
+    '''
+    return name.rstrip('.').lower()
+
+
+def get_record_set_count(zone):
+    return getattr(zone, 'resourcerecordsetcount', None)
+
+
+class RecordIndex:
+    '''Route53 record sets of all hosted zones (thread-safe)'''
+
+    def __init__(self, region: str):
+        self.connection = get_connection('route53', region)
+        self.lock = threading.RLock()
+        self.zones = None
+        # normalized zone name -> ZoneRecords
+        self.zone_records = {}
+
+    def get_zones(self) -> dict:
+        '''Get all hosted zones by normalized name (a single ListHostedZones call per 100 zones)'''
+        with self.lock:
+            if self.zones is None:
+                self.zones = {normalize_name(zone.name): zone for zone in self.connection.get_zones()}
+            return self.zones
+
+    def get_zone(self, name: str):
+        '''Get the hosted zone the given DNS name belongs to (longest matching zone name), None if not found'''
+        if not name:
+            # e.g. physical resource ID of a record set during stack creation
+            return None
+        zones = self.get_zones()
+        name = normalize_name(name)
+        while name:
+            if name in zones:
+                return zones[name]
+            name = name.partition('.')[2]
+        return None
+
+    def get_zone_records(self, zone) -> ZoneRecords:
+        zone_name = normalize_name(zone.name)
+        with self.lock:
+            if zone_name not in self.zone_records:
+                records = {}
+                by_name = collections.defaultdict(list)
+                for record in self.connection.get_all_rrsets(zone.id, maxitems=MAX_RECORDS_PER_PAGE):
+                    name = normalize_name(record.name)
+                    records[(name, record.type, record.identifier)] = record
+                    by_name[name].append(record)
+                self.zone_records[zone_name] = ZoneRecords(get_record_set_count(zone), time.time(), records, by_name)
+            return self.zone_records[zone_name]
+
+    def get(self, name: str, type: str, identifier: str = None):
+        '''Get the record set with the given name, type and set identifier (None if it does not exist)'''
+        zone = self.get_zone(name)
+        if not zone:
+            return None
+        return self.get_zone_records(zone).records.get((normalize_name(name), type, identifier))
+
+    def find(self, name: str, type: str = None) -> list:
+        '''Get all record sets with the given name (and type), e.g. all weighted records of a domain'''
+        zone = self.get_zone(name)
+        if not zone:
+            return []
+        records = self.get_zone_records(zone).by_name.get(normalize_name(name), [])
+        return [record for record in records if not type or record.type == type]
+
+    def get_changes(self, zone):
+        '''Get a new change batch for the given hosted zone'''
+        from boto.route53.record import ResourceRecordSets
+        return ResourceRecordSets(self.connection, zone.id)
+
+    def invalidate(self, name: str):
+        '''Forget the records of the zone of the given DNS name (e.g. after changing them)'''
+        zone = self.get_zone(name)
+        if zone:
+            with self.lock:
+                self.zone_records.pop(normalize_name(zone.name), None)
+
+    def refresh(self):
+        '''List the hosted zones again and forget the records of zones which (might) have changed'''
+        with self.lock:
+            self.zones = None
+            zones = self.get_zones()
+            now = time.time()
+            for zone_name, zone_records in list(self.zone_records.items()):
+                zone = zones.get(zone_name)
+                if (zone is None or get_record_set_count(zone) != zone_records.record_set_count or
+                        zone_records.loaded + RECORDS_MAX_AGE < now):
+                    del self.zone_records[zone_name]
+
+
+def get_record_index(region: str) -> RecordIndex:
+    '''Get the record index of the region (shared by all callers in this process)'''
+    with _lock:
+        if region not in _indexes:
+            _indexes[region] = RecordIndex(region)
+        return _indexes[region]
+
+
+def clear():
+    '''Forget all record indexes'''
+    with _lock:
+        _indexes.clear()
+
+
+def get_change_id(response: dict) -> str:
+    '''
+    Get the ID of the change submitted by ChangeResourceRecordSets (ResourceRecordSets.commit)
+
+    >>> get_change_id({'ChangeResourceRecordSetsResponse': {'ChangeInfo': {'Id': '/change/C2682N5HXP0BZ4'}}})
+    'C2682N5HXP0BZ4'
+    '''
+    return response['ChangeResourceRecordSetsResponse']['ChangeInfo']['Id'].rsplit('/', 1)[-1]
+
+
+def wait_for_changes(region: str, change_ids: list, timeout: int) -> list:
+    '''
+    Poll the changes until Route53 propagated them to all its DNS servers (INSYNC) or the timeout expired
+
+    Polling starts after CHANGE_POLL_DELAY seconds and backs off exponentially.
+    Returns change_id, status and seconds waited for every change.
+    '''
+    connection = get_connection('route53', region)
+    start = time.time()
+    delay = CHANGE_POLL_DELAY
+    results = collections.OrderedDict((change_id, {'change_id': change_id, 'status': 'PENDING', 'seconds': None})
+                                      for change_id in change_ids)
+    while True:
+        time.sleep(min(delay, max(0, timeout - (time.time() - start))))
+        elapsed = time.time() - start
+        for result in results.values():
+            if result['status'] != 'INSYNC':
+                response = retry_throttled(connection.get_change)(result['change_id'])
+                result['status'] = response['GetChangeResponse']['ChangeInfo']['Status']
+                if result['status'] == 'INSYNC':
+                    result['seconds'] = round(elapsed, 1)
+        if all(result['status'] == 'INSYNC' for result in results.values()) or elapsed >= timeout:
+            return list(results.values())
+        delay = min(delay * 2, CHANGE_POLL_MAX_DELAY)
@@ -1,12 +1,9 @@
-import boto.ec2
-import boto.vpc
-import boto.s3
-import boto3
 import click
 import json
 import re
 from clickclick import Action
 from senza.aws import get_security_group
+from senza.connections import get_connection, get_resource
 
 __author__ = 'hjacobs'
 
@@ -56,9 +53,9 @@ def check_security_group(sg_name, rules, region, allow_from_self=False):
         create_sg = click.confirm('Security group {} does not exist. Do you want Senza to create it now?'.format(
             sg_name), default=True)
         if create_sg:
-            vpc_conn = boto.vpc.connect_to_region(region)
+            vpc_conn = get_connection('vpc', region)
             vpcs = vpc_conn.get_all_vpcs()
-            ec2_conn = boto.ec2.connect_to_region(region)
+            ec2_conn = get_connection('ec2', region)
             sg = ec2_conn.create_security_group(sg_name, 'Application security group', vpc_id=vpcs[0].id)
             sg.add_tags({'Name': sg_name})
             for proto, port in rules:
@@ -69,7 +66,7 @@ def check_security_group(sg_name, rules, region, allow_from_self=False):
 
 
 def get_account_id(region):
-    conn = boto.iam.connect_to_region(region)
+    conn = get_connection('iam', region)
     roles = conn.list_roles()['list_roles_response']['list_roles_result']['roles']
     if not roles:
         with Action('Creating temporary IAM role to determine account ID..'):
@@ -84,7 +81,7 @@ def get_account_id(region):
 
 
 def get_account_alias(region):
-    conn = boto.iam.connect_to_region(region)
+    conn = get_connection('iam', region)
     resp = conn.get_account_alias()
     return resp['list_account_aliases_response']['list_account_aliases_result']['account_aliases'][0]
 
@@ -92,7 +89,7 @@ def get_account_alias(region):
 def get_mint_bucket_name(region: str):
     account_id = get_account_id(region)
     account_alias = get_account_alias(region)
-    s3 = boto3.resource('s3')
+    s3 = get_resource('s3')
     parts = account_alias.split('-')
     prefix = parts[0]
     bucket_name = '{}-stups-mint-{}-{}'.format(prefix, account_id, region)
@@ -129,7 +126,7 @@ def get_iam_role_policy(application_id: str, bucket_name: str, region: str):
 def check_iam_role(application_id: str, bucket_name: str, region: str):
     role_name = 'app-{}'.format(application_id)
     with Action('Checking IAM role {}..'.format(role_name)):
-        iam = boto.iam.connect_to_region(region)
+        iam = get_connection('iam', region)
         exists = False
         try:
             iam.get_role(role_name)
@@ -154,7 +151,7 @@ def check_s3_bucket(bucket_name: str, region: str):
     with Action("Checking S3 bucket {}..".format(bucket_name)):
         exists = False
         try:
-            s3 = boto.s3.connect_to_region(region)
+            s3 = get_connection('s3', region)
             exists = s3.lookup(bucket_name, validate=True)
         except:
             pass
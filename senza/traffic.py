@@ -1,16 +1,47 @@
-from boto.route53.record import ResourceRecordSets
 import click
-from clickclick import warning, action, ok, print_table, Action
+from clickclick import warning, action, ok, info, print_table, Action
 import collections
-from .aws import get_stacks, StackReference
-
-import boto.route53
+import contextlib
+import copy
+import functools
+import sys
+import time
+from .aws import get_stacks, StackReference, retry_throttled
+from .connections import get_connection
+from .route53 import get_record_index, get_change_id, wait_for_changes
+from .utils import parallel_map
+from .weights import solve_changed_weights
+
+import boto.exception
 
 PERCENT_RESOLUTION = 2
 FULL_PERCENTAGE = PERCENT_RESOLUTION * 100
 
+# Route53 limits per ChangeBatch (UPSERT changes count twice)
+MAX_CHANGE_BATCH_RECORDS = 1000
+MAX_CHANGE_BATCH_VALUE_LENGTH = 32000
+
+# a single change of a weighted CNAME record: "record" is None for new records (CREATE)
+RecordChange = collections.namedtuple('RecordChange', 'action record dns_name identifier weight values')
+
+# the new weights of the records of a stack's domain
+TrafficChange = collections.namedtuple('TrafficChange', 'version zone rr new_record_weights percentage')
+
+# hosted zone of a recorded zone file (senza traffic --simulate)
+SimulatedZone = collections.namedtuple('SimulatedZone', 'id name')
+
+
+@contextlib.contextmanager
+def progress_to_stderr(enabled: bool = True):
+    '''Print the planning and progress output to stderr, e.g. to keep stdout a single JSON document'''
+    if enabled:
+        with contextlib.redirect_stdout(sys.stderr):
+            yield
+    else:
+        yield
+
 
-def get_weights(dns_name: str, identifier: str, rr: ResourceRecordSets, all_identifiers) -> ({str: int}, int, int):
+def get_weights(dns_name: str, identifier: str, rr: list, all_identifiers) -> ({str: int}, int, int):
     """
     For the given dns_name, get the dns record weights from provided dns record set
     followed by partial count and partial weight sum.
@@ -103,32 +134,159 @@ def compensate(calculation_error, compensations, identifier, new_record_weights,
     return percentage
 
 
-def set_new_weights(dns_name, identifier, lb_dns_name: str, new_record_weights, percentage, rr):
-    action('Setting weights for {dns_name}..', **vars())
+def calculate_exact_weights(identifier, known_record_weights, partial_count, partial_sum, percentage,
+                            identifier_versions):
+    '''
+    Calculate the new weights with the exact solver (see senza.weights)
+
+    Returns the new weights, the changes of the weights, the compensations and the (adjusted) percentage.
+    '''
+    compensations = {}
+    changed_weights = solve_changed_weights(known_record_weights, identifier, percentage, FULL_PERCENTAGE,
+                                            identifier_versions)
+    new_record_weights = dict(known_record_weights)
+    new_record_weights.update(changed_weights)
+    # the weights of dark versions do not change (missing deltas are 0)
+    deltas = {i: w - known_record_weights.get(i, 0) for i, w in changed_weights.items()
+              if w != known_record_weights.get(i, 0)}
+    adjusted_percentage = new_record_weights[identifier]
+    if adjusted_percentage and adjusted_percentage != percentage:
+        compensations[identifier] = adjusted_percentage - percentage
+        if partial_count:
+            warning(
+                ("Changing given percentage from {} to {} " +
+                 "because all other versions are already getting the possible minimum traffic").format(
+                    percentage / PERCENT_RESOLUTION, adjusted_percentage / PERCENT_RESOLUTION))
+        percentage = adjusted_percentage
+    return new_record_weights, deltas, compensations, percentage
+
+
+def calculate_legacy_weights(identifier, known_record_weights, partial_count, partial_sum, percentage,
+                             identifier_versions):
+    '''
+    Calculate the new weights like senza did before the exact solver (compatibility mode)
+
+    Returns the new weights, the changes of the weights, the compensations and the (adjusted) percentage.
+    '''
+    compensations = {}
+    if partial_count:
+        delta = int((FULL_PERCENTAGE - percentage - partial_sum) / partial_count)
+    else:
+        delta = 0
+        if percentage > 0:
+            # will put the only last version to full traffic percentage
+            compensations[identifier] = FULL_PERCENTAGE - percentage
+            percentage = int(FULL_PERCENTAGE)
+    new_record_weights, deltas = calculate_new_weights(delta, identifier, known_record_weights, percentage)
+    total_weight = sum(new_record_weights.values())
+    calculation_error = FULL_PERCENTAGE - total_weight
+    if calculation_error and calculation_error < FULL_PERCENTAGE:
+        percentage = compensate(calculation_error, compensations, identifier,
+                                new_record_weights, partial_count, percentage, identifier_versions)
+    return new_record_weights, deltas, compensations, percentage
+
+
+def get_record_changes(dns_name, identifier, lb_dns_name: str, new_record_weights, rr) -> list:
+    '''Get the record changes needed to set the new weights of the domain's weighted CNAME records'''
+    record_changes = []
     did_the_upsert = False
     for r in rr:
         if r.type == 'CNAME' and r.name == dns_name:
             w = new_record_weights[r.identifier]
             if w:
                 if int(r.weight) != w:
-                    r.weight = w
-                    rr.add_change_record('UPSERT', r)
+                    record_changes.append(RecordChange('UPSERT', r, dns_name, r.identifier, w, r.resource_records))
                 if identifier == r.identifier:
                     did_the_upsert = True
             else:
-                rr.add_change_record('DELETE', r)
+                record_changes.append(RecordChange('DELETE', r, dns_name, r.identifier, r.weight, r.resource_records))
     if new_record_weights[identifier] > 0 and not did_the_upsert:
-        change = rr.add_change('CREATE', dns_name, 'CNAME', ttl=20, identifier=identifier,
-                               weight=new_record_weights[identifier])
-        change.add_value(lb_dns_name)
-    if rr.changes:
-        rr.commit()
+        record_changes.append(RecordChange('CREATE', None, dns_name, identifier, new_record_weights[identifier],
+                                           [lb_dns_name]))
+    return record_changes
+
+
+def add_record_changes(changes, record_changes: list):
+    '''Add the record changes to the change batch (ResourceRecordSets)'''
+    for record_change in record_changes:
+        if record_change.record is None:
+            change = changes.add_change(record_change.action, record_change.dns_name, 'CNAME', ttl=20,
+                                        identifier=record_change.identifier, weight=record_change.weight)
+            for value in record_change.values:
+                change.add_value(value)
+        elif record_change.action == 'UPSERT':
+            # the (shared) record of the index is not changed
+            changes.add_change_record(record_change.action, get_weighted_record(record_change))
+        else:
+            changes.add_change_record(record_change.action, record_change.record)
+
+
+def get_weighted_record(record_change: RecordChange):
+    '''Get a copy of the changed record with the new weight'''
+    record = copy.copy(record_change.record)
+    record.weight = record_change.weight
+    return record
+
+
+def get_change_size(record_changes: list) -> (int, int):
+    '''
+    Get the number of resource records and the total length of their values as counted by Route53
+
+    >>> get_change_size([RecordChange('UPSERT', None, 'app.example.org.', 'app-1', 100, ['app-1.elb.example.org']),
+    ...                  RecordChange('DELETE', None, 'app.example.org.', 'app-2', 0, ['app-2.elb.example.org'])])
+    (3, 63)
+    '''
+    records = 0
+    length = 0
+    for record_change in record_changes:
+        factor = 2 if record_change.action == 'UPSERT' else 1
+        records += factor * len(record_change.values)
+        length += factor * sum(len(value) for value in record_change.values)
+    return records, length
+
+
+def split_change_batches(groups: list) -> list:
+    '''
+    Pack the groups of record changes into as few Route53 change batches as possible
+
+    The changes of a group (domain) are never split, i.e. they are always applied atomically.
+
+    >>> change = RecordChange('DELETE', None, 'app.example.org.', 'app-1', 0, ['x' * 20000])
+    >>> [len(batch) for batch in split_change_batches([[change], [change, change], [change]])]
+    [1, 2, 1]
+    '''
+    batches = []
+    batch = []
+    batch_records = batch_length = 0
+    for group in groups:
+        records, length = get_change_size(group)
+        if batch and (batch_records + records > MAX_CHANGE_BATCH_RECORDS or
+                      batch_length + length > MAX_CHANGE_BATCH_VALUE_LENGTH):
+            batches.append(batch)
+            batch = []
+            batch_records = batch_length = 0
+        batch.extend(group)
+        batch_records += records
+        batch_length += length
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def set_new_weights(dns_name, identifier, lb_dns_name: str, new_record_weights, percentage, rr, changes):
+    action('Setting weights for {dns_name}..', **vars())
+    record_changes = get_record_changes(dns_name, identifier, lb_dns_name, new_record_weights, rr)
+    if record_changes:
+        add_record_changes(changes, record_changes)
+        change_id = get_change_id(changes.commit())
         if sum(new_record_weights.values()) == 0:
             ok(' DISABLED')
         else:
             ok()
+        return change_id
     else:
         ok(' not changed')
+        return None
 
 
 def dump_traffic_changes(stack_name: str,
@@ -149,7 +307,7 @@ def dump_traffic_changes(stack_name: str,
             'identifier': i,
             'old_weight%': known_record_weights.get(i),
             # 'delta': (delta if new_record_weights[i] else 0 if i != identifier else forced_delta),
-            'delta': deltas[i],
+            'delta': deltas.get(i, 0),
             'compensation': compensations.get(i),
             'new_weight%': new_record_weights.get(i),
         } for i in known_record_weights.keys()
@@ -183,20 +341,54 @@ class StackVersion(collections.namedtuple('StackVersion', 'name version domain l
         return self.domain + '.'
 
 
+def get_load_balancers(elb, lb_name: str) -> list:
+    try:
+        return retry_throttled(elb.get_all_load_balancers)([lb_name])
+    except boto.exception.BotoServerError as e:
+        if e.error_code != 'LoadBalancerNotFound':
+            raise
+    return []
+
+
+def get_load_balancer_dns_names(region: str, lb_names: list) -> dict:
+    '''Get the DNS names of the given load balancers with a single DescribeLoadBalancers call'''
+    if not lb_names:
+        return {}
+    elb = get_connection('ec2.elb', region)
+    try:
+        lbs = retry_throttled(elb.get_all_load_balancers)(lb_names)
+    except boto.exception.BotoServerError as e:
+        if e.error_code != 'LoadBalancerNotFound':
+            raise
+        # some load balancer does not exist (anymore): look them up one by one, ignore missing ones
+        lbs = []
+        for result in parallel_map(functools.partial(get_load_balancers, elb), lb_names):
+            lbs.extend(result)
+    return {lb.name: lb.dns_name for lb in lbs}
+
+
 def get_stack_versions(stack_name: str, region: str):
-    cf = boto.cloudformation.connect_to_region(region)
-    for stack in get_stacks([StackReference(name=stack_name, version=None)], region):
-        if stack.stack_status in ('ROLLBACK_COMPLETE', 'CREATE_FAILED'):
-            continue
-        details = cf.describe_stacks(stack.stack_id)[0]
-        resources = cf.describe_stack_resources(stack.stack_id)
+    cf = get_connection('cloudformation', region)
+    stacks = [stack for stack in get_stacks([StackReference(name=stack_name, version=None)], region)
+              if stack.stack_status not in ('ROLLBACK_COMPLETE', 'CREATE_FAILED')]
+
+    def get_details(stack):
+        details = retry_throttled(cf.describe_stacks)(stack.stack_id)[0]
+        resources = retry_throttled(cf.describe_stack_resources)(stack.stack_id)
+        return details, resources
+
+    # fetch the details of all versions concurrently, then resolve all load balancers at once
+    stack_details = parallel_map(get_details, stacks)
+    lb_names = sorted(set(res.physical_resource_id for details, resources in stack_details for res in resources
+                          if res.resource_type == 'AWS::ElasticLoadBalancing::LoadBalancer'))
+    lb_dns_names = get_load_balancer_dns_names(region, lb_names)
+
+    for details, resources in stack_details:
         lb_dns_name = None
         domain = None
         for res in resources:
             if res.resource_type == 'AWS::ElasticLoadBalancing::LoadBalancer':
-                elb = boto.ec2.elb.connect_to_region(region)
-                lbs = elb.get_all_load_balancers([res.physical_resource_id])
-                lb_dns_name = lbs[0].dns_name
+                lb_dns_name = lb_dns_names.get(res.physical_resource_id)
             elif res.resource_type == 'AWS::Route53::RecordSet':
                 if 'version' not in res.logical_resource_id.lower():
                     domain = res.physical_resource_id
@@ -211,10 +403,10 @@ def get_version(versions: list, version: str):
 
 
 def get_zone(region: str, domain: str):
-    dns_conn = boto.route53.connect_to_region(region)
-    zone = dns_conn.get_zone(domain + '.')
+    '''Get the hosted zone of the given domain name (from the shared Route53 record index)'''
+    zone = get_record_index(region).get_zone(domain)
     if not zone:
-        raise ValueError('Zone {} not found'.format(domain))
+        raise ValueError('Zone for domain {} not found'.format(domain))
     return zone
 
 
@@ -233,9 +425,8 @@ def print_version_traffic(stack_ref: StackReference, region):
     if not version.domain:
         raise click.UsageError('Stack {} version {} has no domain'.format(version.name, version.version))
 
-    domain = version.domain.split('.', 1)[1]
-    zone = get_zone(region, domain)
-    rr = zone.get_records()
+    get_zone(region, version.domain)
+    rr = get_record_index(region).find(version.domain, 'CNAME')
     known_record_weights, partial_count, partial_sum = get_weights(version.dns_name, version.identifier, rr,
                                                                    identifier_versions.keys())
 
@@ -260,9 +451,15 @@ def print_version_traffic(stack_ref: StackReference, region):
                 sorted(rows, key=lambda x: identifier_versions.get(x['identifier'], '')))
 
 
-def change_version_traffic(stack_ref: StackReference, percentage: float, region):
+def plan_version_traffic(stack_ref: StackReference, percentage: float, region, versions: list = None,
+                         rr: list = None, legacy: bool = False, zone=None) -> TrafficChange:
+    '''Calculate (and print) the new weights of the stack's domain records, nothing is changed yet
 
-    versions = list(get_stack_versions(stack_ref.name, region))
+    The stack versions, the domain's hosted zone and current records are fetched unless given.
+    With legacy, the weights are calculated like senza did before the exact solver (see senza.weights).
+    '''
+    if versions is None:
+        versions = list(get_stack_versions(stack_ref.name, region))
     identifier_versions = collections.OrderedDict(
         (version.identifier, version.version) for version in versions)
     version = get_version(versions, stack_ref.version)
@@ -272,9 +469,10 @@ def change_version_traffic(stack_ref: StackReference, percentage: float, region)
     if not version.domain:
         raise click.UsageError('Stack {} version {} has no domain'.format(version.name, version.version))
 
-    domain = version.domain.split('.', 1)[1]
-    zone = get_zone(region, domain)
-    rr = zone.get_records()
+    if zone is None:
+        zone = get_zone(region, version.domain)
+    if rr is None:
+        rr = get_record_index(region).find(version.domain, 'CNAME')
     percentage = int(percentage * PERCENT_RESOLUTION)
     known_record_weights, partial_count, partial_sum = get_weights(version.dns_name, identifier, rr,
                                                                    identifier_versions.keys())
@@ -285,21 +483,9 @@ def change_version_traffic(stack_ref: StackReference, percentage: float, region)
         ok(msg='DNS record "{dns_name}" will be removed from that stack'.format(dns_name=version.dns_name))
     else:
         with Action('Calculating new weights..'):
-            compensations = {}
-            if partial_count:
-                delta = int((FULL_PERCENTAGE - percentage - partial_sum) / partial_count)
-            else:
-                delta = 0
-                if percentage > 0:
-                    # will put the only last version to full traffic percentage
-                    compensations[identifier] = FULL_PERCENTAGE - percentage
-                    percentage = int(FULL_PERCENTAGE)
-            new_record_weights, deltas = calculate_new_weights(delta, identifier, known_record_weights, percentage)
-            total_weight = sum(new_record_weights.values())
-            calculation_error = FULL_PERCENTAGE - total_weight
-            if calculation_error and calculation_error < FULL_PERCENTAGE:
-                percentage = compensate(calculation_error, compensations, identifier,
-                                        new_record_weights, partial_count, percentage, identifier_versions)
+            calculate = calculate_legacy_weights if legacy else calculate_exact_weights
+            new_record_weights, deltas, compensations, percentage = calculate(
+                identifier, known_record_weights, partial_count, partial_sum, percentage, identifier_versions)
             assert sum(new_record_weights.values()) == FULL_PERCENTAGE
         dump_traffic_changes(stack_ref.name,
                              identifier,
@@ -308,4 +494,264 @@ def change_version_traffic(stack_ref: StackReference, percentage: float, region)
                              new_record_weights,
                              compensations,
                              deltas)
-    set_new_weights(version.dns_name, identifier, version.lb_dns_name, new_record_weights, percentage, rr)
+    return TrafficChange(version, zone, rr, new_record_weights, percentage)
+
+
+def change_version_traffic(stack_ref: StackReference, percentage: float, region, legacy: bool = False) -> list:
+    '''Change the traffic of the stack version, returns the IDs of the submitted Route53 changes'''
+    change = plan_version_traffic(stack_ref, percentage, region, legacy=legacy)
+    version = change.version
+    index = get_record_index(region)
+    change_id = set_new_weights(version.dns_name, version.identifier, version.lb_dns_name, change.new_record_weights,
+                                change.percentage, change.rr, index.get_changes(change.zone))
+    # read the changed records again when needed
+    index.invalidate(version.domain)
+    return [change_id] if change_id else []
+
+
+def load_traffic_batch(fd) -> list:
+    '''
+    Read the stack versions and percentages of a batch file (YAML list)
+
+    >>> import io
+    >>> load_traffic_batch(io.StringIO('- {stack_name: app, stack_version: v2, percentage: 150}'))
+    [(StackReference(name='app', version='v2'), 100.0)]
+    '''
+    import yaml
+    try:
+        entries = yaml.safe_load(fd)
+    except yaml.YAMLError as e:
+        raise click.UsageError('Invalid batch file: {}'.format(e))
+    if not isinstance(entries, list):
+        raise click.UsageError('Batch file must contain a list of stack_name, stack_version and percentage')
+    batch = []
+    for entry in entries:
+        try:
+            stack_ref = StackReference(str(entry['stack_name']), str(entry['stack_version']))
+            percentage = float(entry['percentage'])
+        except (TypeError, KeyError, ValueError):
+            raise click.UsageError('Invalid batch entry {}: stack_name, stack_version and percentage '
+                                   'are required'.format(entry))
+        # clamp like the command line argument
+        batch.append((stack_ref, min(100.0, max(0.0, percentage))))
+    return batch
+
+
+def change_traffic_batch(batch: list, region, legacy: bool = False) -> list:
+    '''
+    Change the traffic of many stack versions at once, returns the IDs of the submitted Route53 changes
+
+    All weights are calculated from the same snapshot of the hosted zones first, then the changes
+    of all domains of a hosted zone are committed in as few change batches as possible.
+    '''
+    changes_by_zone = collections.OrderedDict()
+    domains = set()
+    for stack_ref, percentage in batch:
+        change = plan_version_traffic(stack_ref, percentage, region, legacy=legacy)
+        version = change.version
+        if version.domain in domains:
+            raise click.UsageError('Domain {} is used by more than one batch entry'.format(version.domain))
+        domains.add(version.domain)
+        record_changes = get_record_changes(version.dns_name, version.identifier, version.lb_dns_name,
+                                            change.new_record_weights, change.rr)
+        if record_changes:
+            changes_by_zone.setdefault(change.zone.id, (change.zone, []))[1].append(record_changes)
+
+    index = get_record_index(region)
+    change_ids = []
+    for zone, groups in changes_by_zone.values():
+        for record_changes in split_change_batches(groups):
+            with Action('Setting weights for {} records in zone {}..'.format(len(record_changes), zone.name)):
+                changes = index.get_changes(zone)
+                add_record_changes(changes, record_changes)
+                change_ids.append(get_change_id(changes.commit()))
+    if not changes_by_zone:
+        ok('No weights changed')
+    for domain in domains:
+        index.invalidate(domain)
+    return change_ids
+
+
+def load_simulation(fd) -> (SimulatedZone, list, list):
+    '''
+    Read a recorded hosted zone, its records and the stack versions from a JSON file (senza traffic --simulate)
+
+    The file contains the "HostedZone" and "ResourceRecordSets" as returned by Route53 (e.g. by
+    "aws route53 get-hosted-zone" and "aws route53 list-resource-record-sets") and the "StackVersions"
+    (name, version, domain and lb_dns_name of every stack version).
+    '''
+    import json
+    from boto.route53.record import Record
+    try:
+        data = json.load(fd)
+        hosted_zone = data.get('HostedZone', {})
+        zone = SimulatedZone(hosted_zone.get('Id', 'simulated'), hosted_zone.get('Name', ''))
+        rr = [Record(r['Name'], r['Type'], r.get('TTL'), [v['Value'] for v in r.get('ResourceRecords', [])],
+                     identifier=r.get('SetIdentifier'), weight=r.get('Weight'))
+              for r in data['ResourceRecordSets']]
+        versions = [StackVersion(v['name'], str(v['version']), v['domain'], v.get('lb_dns_name'))
+                    for v in data['StackVersions']]
+    except ValueError as e:
+        raise click.UsageError('Invalid simulation file: {}'.format(e))
+    except (AttributeError, TypeError, KeyError) as e:
+        raise click.UsageError('Invalid simulation file: HostedZone, ResourceRecordSets and StackVersions '
+                               'are expected ({})'.format(e))
+    for r in rr:
+        # the traffic of a domain is only distributed with weighted CNAME records
+        if r.type == 'CNAME' and r.weight is None:
+            raise click.UsageError('Invalid simulation file: CNAME record {} has no Weight'.format(r.name))
+    return zone, rr, versions
+
+
+def simulate_traffic(batch: list, fd, legacy: bool = False) -> list:
+    '''
+    Calculate and print the change batches to change the traffic of the stack versions without calling AWS
+
+    The hosted zone and the stack versions are read from the recorded JSON file (see load_simulation).
+    Only the change batches are printed to stdout (e.g. a single JSON document), the new weights to stderr.
+    Returns the record changes of every change batch.
+    '''
+    zone, rr, versions = load_simulation(fd)
+    groups = []
+    domains = set()
+    for stack_ref, percentage in batch:
+        stack_versions = [version for version in versions if version.name == stack_ref.name]
+        with progress_to_stderr():
+            change = plan_version_traffic(stack_ref, percentage, None, versions=stack_versions, rr=rr,
+                                          legacy=legacy, zone=zone)
+        version = change.version
+        if version.domain in domains:
+            raise click.UsageError('Domain {} is used by more than one batch entry'.format(version.domain))
+        domains.add(version.domain)
+        record_changes = get_record_changes(version.dns_name, version.identifier, version.lb_dns_name,
+                                            change.new_record_weights, rr)
+        if record_changes:
+            groups.append(record_changes)
+
+    change_batches = split_change_batches(groups)
+    rows = []
+    for i, record_changes in enumerate(change_batches):
+        for record_change in record_changes:
+            rows.append({'change_batch': i + 1,
+                         'action': record_change.action,
+                         'dns_name': record_change.dns_name,
+                         'identifier': record_change.identifier,
+                         'weight': int(record_change.weight),
+                         'values': ', '.join(record_change.values)})
+    print_table('change_batch action dns_name identifier weight values'.split(), rows)
+    if not rows:
+        ok('No weights changed')
+    return change_batches
+
+
+def get_current_percentage(version: StackVersion, rr: list) -> int:
+    '''Get the current weight of the stack version's record (in PERCENT_RESOLUTION units)'''
+    known_record_weights, partial_count, partial_sum = get_weights(version.dns_name, version.identifier, rr, [])
+    return known_record_weights[version.identifier]
+
+
+def get_pending_steps(steps: list, current: int) -> list:
+    '''
+    Get the steps of the ramp which were not reached yet (the ramp might have been interrupted before)
+
+    >>> get_pending_steps([1, 5, 25, 50, 100], 10 * PERCENT_RESOLUTION)
+    [25, 50, 100]
+
+    >>> get_pending_steps([50, 10, 0], 10 * PERCENT_RESOLUTION)
+    [0]
+    '''
+    if steps[-1] >= steps[0]:
+        return [step for step in steps if step * PERCENT_RESOLUTION > current]
+    return [step for step in steps if step * PERCENT_RESOLUTION < current]
+
+
+def update_records(rr: list, record_changes: list):
+    '''Apply the committed record changes to our own snapshot of the domain's records'''
+    from boto.route53.record import Record
+    for record_change in record_changes:
+        if record_change.action == 'DELETE':
+            rr.remove(record_change.record)
+        elif record_change.action == 'UPSERT':
+            rr[rr.index(record_change.record)] = get_weighted_record(record_change)
+        elif record_change.record is None:
+            rr.append(Record(record_change.dns_name, 'CNAME', 20, list(record_change.values),
+                             identifier=record_change.identifier, weight=record_change.weight))
+
+
+def ramp_version_traffic(stack_ref: StackReference, steps: list, interval: int, region, check=None,
+                         wait_timeout: int = None, legacy: bool = False):
+    '''
+    Shift the traffic to the stack version step by step, waiting INTERVAL seconds between the steps
+
+    With a wait_timeout, every step's change must be in sync (propagated) before the interval starts,
+    the status of all steps' changes is printed at the end (the progress is printed to stderr then).
+
+    The domain's records are read once and kept up to date with our own changes. Steps already reached
+    are skipped, i.e. an interrupted ramp continues where it stopped when started again.
+    The optional check function is called with the stack version before every step and
+    should raise an exception to stop the ramp (e.g. if not enough instances are healthy).
+    '''
+    versions = list(get_stack_versions(stack_ref.name, region))
+    version = get_version(versions, stack_ref.version)
+    if not version.domain:
+        raise click.UsageError('Stack {} version {} has no domain'.format(version.name, version.version))
+
+    index = get_record_index(region)
+    zone = get_zone(region, version.domain)
+    rr = list(index.find(version.domain, 'CNAME'))
+    current = get_current_percentage(version, rr)
+    pending_steps = get_pending_steps(steps, current)
+    if not pending_steps:
+        ok('{} already gets {}% of the traffic'.format(version.identifier, current / PERCENT_RESOLUTION))
+        return
+
+    wait = wait_timeout is not None
+    statuses = []
+    try:
+        with progress_to_stderr(wait):
+            for i, step in enumerate(pending_steps):
+                if i > 0:
+                    info('Waiting {} seconds before the next step ({}%)..'.format(interval, step))
+                    time.sleep(interval)
+                if check:
+                    check(version)
+                change = plan_version_traffic(stack_ref, step, region, versions=versions, rr=rr, legacy=legacy)
+                record_changes = get_record_changes(version.dns_name, version.identifier, version.lb_dns_name,
+                                                    change.new_record_weights, rr)
+                with Action('Setting weights for {} ({}%)..'.format(version.dns_name, step)) as act:
+                    if record_changes:
+                        changes = index.get_changes(zone)
+                        add_record_changes(changes, record_changes)
+                        change_id = get_change_id(changes.commit())
+                        update_records(rr, record_changes)
+                    else:
+                        change_id = None
+                        act.ok('not changed')
+                if change_id and wait:
+                    check_in_sync(region, [change_id], wait_timeout, statuses=statuses)
+    finally:
+        # other commands must read the changed records again
+        index.invalidate(version.domain)
+        if wait:
+            # also if a step failed (e.g. was not in sync in time)
+            print_table('change_id status seconds'.split(), statuses)
+
+
+def check_in_sync(region, change_ids: list, timeout: int, show: bool = False, statuses: list = None) -> list:
+    '''Wait for the changes to be propagated, raises an exception if they are not in sync after TIMEOUT seconds
+
+    With show, the status of every change is printed to stdout (e.g. as JSON for pipelines), the progress
+    to stderr. The statuses are also appended to the given list (even if the changes are not in sync).
+    '''
+    with progress_to_stderr(show):
+        with Action('Waiting for {} Route53 change(s) to be in sync..'.format(len(change_ids))):
+            results = wait_for_changes(region, change_ids, timeout)
+    if statuses is not None:
+        statuses.extend(results)
+    if show:
+        print_table('change_id status seconds'.split(), results)
+    pending = [result['change_id'] for result in results if result['status'] != 'INSYNC']
+    if pending:
+        raise click.ClickException('Route53 change(s) {} not in sync after {} seconds'.format(
+            ', '.join(pending), timeout))
+    return results
@@ -1,6 +1,19 @@
+import functools
+import math
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import pystache
 
+# default upper bound for concurrent AWS API calls
+DEFAULT_MAX_WORKERS = 10
+
+# number of parsed mustache templates to keep in memory
+TEMPLATE_CACHE_SIZE = 1024
+
+_renderers = threading.local()
+
 
 def named_value(d):
     return next(iter(d.items()))
@@ -26,6 +39,94 @@ def camel_case_to_underscore(name):
     return re.sub('([a-z0-9])([A-Z])', r'\1_\2', s1).lower()
 
 
-def pystache_render(*args, **kwargs):
-    render = pystache.Renderer(missing_tags='strict')
-    return render.render(*args, **kwargs)
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def parse_template(template: str):
+    '''Parse the mustache template source (memoized, least recently used templates are evicted)'''
+    return pystache.parse(template)
+
+
+def get_renderer():
+    '''Get the mustache renderer (one per thread as the renderer keeps the current context)'''
+    renderer = getattr(_renderers, 'renderer', None)
+    if renderer is None:
+        renderer = _renderers.renderer = pystache.Renderer(missing_tags='strict')
+    return renderer
+
+
+def pystache_render(template, *context, **kwargs):
+    '''
+    >>> pystache_render('Hello {{name}}!', {'name': 'World'})
+    'Hello World!'
+
+    >>> pystache_render('Hello {{name}}!', {'name': 'Senza'})
+    'Hello Senza!'
+    '''
+    if isinstance(template, str):
+        template = parse_template(template)
+    return get_renderer().render(template, *context, **kwargs)
+
+
+def pystache_render_structure(obj, context):
+    '''Render the mustache templates in all strings (keys and values) of the given nested dicts and lists
+
+    >>> pystache_render_structure({'a-{{x}}': ['{{x}}', 1, None, 'plain']}, {'x': 'b'})
+    {'a-b': ['b', 1, None, 'plain']}
+    '''
+    renderer = get_renderer()
+
+    def render(o):
+        if isinstance(o, str):
+            if '{{' not in o:
+                # no tags with the default delimiters, nothing to render
+                return o
+            return renderer.render(parse_template(o), context)
+        elif isinstance(o, dict):
+            return {render(key): render(val) for key, val in o.items()}
+        elif isinstance(o, list):
+            return [render(item) for item in o]
+        elif isinstance(o, tuple):
+            return tuple(render(item) for item in o)
+        return o
+    return render(obj)
+
+
+def parallel_map(func, items, max_workers: int = DEFAULT_MAX_WORKERS):
+    '''Call func for every item using a bounded thread pool, results are returned in input order
+
+    >>> parallel_map(lambda x: x * 2, [1, 2, 3])
+    [2, 4, 6]
+
+    >>> parallel_map(str, [])
+    []
+    '''
+    items = list(items)
+    if len(items) < 2 or max_workers < 2:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(func, items))
+
+
+def parse_interval(value: str) -> int:
+    '''
+    Parse a duration like "30s", "5m" or "1h" (plain numbers are seconds)
+
+    >>> parse_interval('5m')
+    300
+
+    >>> parse_interval('90')
+    90
+
+    >>> parse_interval('inf')
+    Traceback (most recent call last):
+    ...
+    ValueError: Invalid duration: inf
+    '''
+    units = {'s': 1, 'm': 60, 'h': 3600}
+    value = value.strip().lower()
+    factor = units.get(value[-1:], None)
+    if factor:
+        value = value[:-1]
+    seconds = float(value) * (factor or 1)
+    if not math.isfinite(seconds):
+        raise ValueError('Invalid duration: {}'.format(value))
+    return int(seconds)
@@ -0,0 +1,129 @@
+'''
+Incremental refresh for the "watch" mode (-W/--watch) of the listing commands
+
+Instead of re-fetching every detail and repainting the whole screen on every refresh,
+the previous snapshot is kept: details are only fetched again for stacks whose cheap
+change indicator (e.g. stack status and last update time from ListStacks) moved
+and only the terminal lines which changed are redrawn.
+'''
+import contextlib
+import io
+import re
+import shutil
+import sys
+import threading
+import time
+
+import click
+
+# seconds after which details are fetched again, even if no change indicator moved
+MAX_SNAPSHOT_AGE = 60
+
+ANSI_ESCAPE_PATTERN = re.compile(r'\x1b\[[0-9;]*[A-Za-z]')
+
+
+def get_stack_indicator(stack):
+    '''Cheap change indicator of a stack summary as returned by ListStacks
+
+    Returns None for stacks in transition (their resources and events change without a visible indicator).
+    '''
+    if stack.stack_status.endswith('_IN_PROGRESS'):
+        return None
+    return (stack.stack_status, getattr(stack, 'LastUpdatedTime', None))
+
+
+class Snapshot:
+    '''Details fetched during the previous refreshes, keyed by e.g. stack ID'''
+
+    def __init__(self, max_age: float = MAX_SNAPSHOT_AGE):
+        self.max_age = max_age
+        self.entries = {}
+        self.fetches = 0
+        self.reuses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, indicator, fetch, settled=None):
+        '''Return the previous value of key if its change indicator did not move, call fetch() otherwise
+
+        An indicator of None means "always fetch". The optional settled(value) function
+        can mark values as still changing (e.g. instances not yet "InService"), these are always fetched again.
+        '''
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+        if (entry is not None and indicator is not None and entry[0] == indicator and
+                entry[1] + self.max_age > now):
+            with self.lock:
+                self.reuses += 1
+            return entry[2]
+        value = fetch()
+        with self.lock:
+            self.fetches += 1
+            if settled is None or settled(value):
+                self.entries[key] = (indicator, now, value)
+            else:
+                self.entries.pop(key, None)
+        return value
+
+
+class TerminalBuffer(io.StringIO):
+    '''Capture output as if it was written to the terminal (keep colors)'''
+
+    def isatty(self):
+        return True
+
+
+def visible_length(line: str) -> int:
+    '''
+    >>> visible_length(click.style('abc', fg='green'))
+    3
+    '''
+    return len(ANSI_ESCAPE_PATTERN.sub('', line))
+
+
+class Screen:
+    '''Redraw only the lines of the terminal which changed since the previous refresh
+
+    Falls back to clearing the screen (the old behavior) if the output does not go to a terminal,
+    is not the text table or does not fit into the terminal.
+    '''
+
+    def __init__(self, watch: bool, output: str = 'text', stream=None):
+        self.watch = watch
+        self.stream = stream or sys.stdout
+        self.incremental = watch and output == 'text' and self.stream.isatty()
+        self.lines = None
+
+    @contextlib.contextmanager
+    def draw(self):
+        if not self.incremental:
+            if self.watch:
+                click.clear()
+            yield
+            return
+        buf = TerminalBuffer()
+        with contextlib.redirect_stdout(buf):
+            yield
+        self.update(buf.getvalue().splitlines())
+
+    def fits(self, lines: list) -> bool:
+        width, height = shutil.get_terminal_size()
+        return len(lines) < height and all(visible_length(line) < width for line in lines)
+
+    def update(self, lines: list):
+        if self.lines is None or not self.fits(lines) or not self.fits(self.lines):
+            # full repaint: initial draw or lines would wrap/scroll (cursor positions would be wrong)
+            out = ['\x1b[2J\x1b[H'] + [line + '\n' for line in lines]
+        else:
+            out = []
+            for i, line in enumerate(lines):
+                if i >= len(self.lines) or self.lines[i] != line:
+                    # move cursor to the line and replace it
+                    out.append('\x1b[{};1H\x1b[2K{}'.format(i + 1, line))
+            if len(lines) < len(self.lines):
+                # remove trailing lines of the previous refresh
+                out.append('\x1b[{};1H\x1b[J'.format(len(lines) + 1))
+            out.append('\x1b[{};1H'.format(len(lines) + 1))
+        self.stream.write(''.join(out))
+        self.stream.flush()
+        self.lines = lines
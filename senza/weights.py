@@ -0,0 +1,94 @@
+'''
+Exact integer apportionment of traffic weights between the weighted DNS records of a domain
+
+The stack version we route traffic to gets the requested weight, the remaining weight is shared by all
+other versions currently getting traffic in proportion to their current weights (highest averages method).
+Versions without traffic ("dark" versions) are never given traffic and versions with traffic keep
+at least a weight of 1. The result does not depend on the order of the input.
+'''
+import heapq
+
+# minimum weight of a version which had traffic before (i.e. is not switched off by redistributing)
+MIN_WEIGHT = 1
+
+
+def solve_weights(weights: dict, identifier: str, percentage: int, total: int, priorities: dict = None) -> dict:
+    '''
+    Calculate the new integer weights (summing up to total) giving the identifier the requested percentage
+
+    The requested percentage is lowered if the other versions with traffic cannot keep their minimum weight.
+    Raises ValueError if there are more versions with traffic than the total weight allows.
+    Ties are broken in favour of the version with the higher priority (e.g. the newer version).
+    Runs in O(n + m log m) for n versions of which m get traffic.
+
+    >>> sorted(solve_weights({'v1': 150, 'v2': 50, 'v3': 0}, 'v3', 100, 200).items())
+    [('v1', 75), ('v2', 25), ('v3', 100)]
+
+    >>> sorted(solve_weights({'v1': 200, 'v2': 0}, 'v1', 0, 200).items())
+    [('v1', 0), ('v2', 0)]
+    '''
+    # dark versions keep their weight of 0, all others are replaced by the changed weights
+    new_weights = dict(weights)
+    new_weights.update(solve_changed_weights(weights, identifier, percentage, total, priorities))
+    return new_weights
+
+
+def solve_changed_weights(weights: dict, identifier: str, percentage: int, total: int,
+                          priorities: dict = None) -> dict:
+    '''
+    Calculate the new weights of the identifier and the other versions with traffic (see solve_weights)
+
+    Only the weights which might change are returned, dark versions are left out.
+
+    >>> sorted(solve_changed_weights({'v1': 150, 'v2': 50, 'v3': 0, 'v4': 0}, 'v3', 100, 200).items())
+    [('v1', 75), ('v2', 25), ('v3', 100)]
+    '''
+    others = {i: w for i, w in weights.items() if w > 0}
+    others.pop(identifier, None)
+    if not others:
+        # the only version with traffic gets everything (or nothing)
+        return {identifier: total if percentage > 0 else 0}
+    if percentage >= total:
+        changed_weights = dict.fromkeys(others, 0)
+        changed_weights[identifier] = total
+        return changed_weights
+    if MIN_WEIGHT * len(others) > total:
+        raise ValueError('{} versions with traffic cannot keep a weight of at least {} (total {})'.format(
+            len(others), MIN_WEIGHT, total))
+
+    percentage = max(0, min(percentage, total - MIN_WEIGHT * len(others)))
+    changed_weights = apportion(others, total - percentage, priorities or {})
+    changed_weights[identifier] = percentage
+    return changed_weights
+
+
+def apportion(weights: dict, seats: int, priorities: dict) -> dict:
+    '''
+    Distribute the seats proportionally to the (positive) weights, every weight gets at least MIN_WEIGHT seats
+
+    This is the D'Hondt (highest averages) method, which is house monotone: with fewer seats to distribute
+    nobody gets more seats. Instead of handing out all seats one by one, every weight starts with its
+    lower quota of the seats left after the minimum weights (D'Hondt never gives less), only the remaining
+    seats (less than two per weight) are handed out in the order of the highest averages.
+
+    >>> sorted(apportion({'a': 3, 'b': 1}, 8, {}).items())
+    [('a', 6), ('b', 2)]
+    '''
+    free_seats = seats - MIN_WEIGHT * len(weights)
+    total = sum(weights.values())
+    # ties are broken by rank: higher priority first, then the "larger" identifier
+    order = sorted(weights, key=lambda i: (priorities.get(i, ''), i), reverse=True)
+    result = {}
+    # next average (weight / (seats + 1)) per candidate, highest first: the float quotients of small integers
+    # (Route53 weights are 0..255) are equal if and only if the fractions are equal, i.e. ties are exact
+    heap = []
+    for rank, i in enumerate(order):
+        w = weights[i]
+        result[i] = max(MIN_WEIGHT, w * free_seats // total)
+        heap.append((-w / (result[i] + 1), rank, i))
+    heapq.heapify(heap)
+    for _ in range(seats - sum(result.values())):
+        average, rank, i = heap[0]
+        result[i] += 1
+        heapq.heapreplace(heap, (-weights[i] / (result[i] + 1), rank, i))
+    return result
@@ -0,0 +1,17 @@
+import pytest
+import senza.cache
+import senza.connections
+import senza.route53
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(monkeypatch, tmpdir):
+    '''Never share cached AWS metadata between tests or with the user's cache directory'''
+    monkeypatch.setenv('SENZA_CACHE_DIR', str(tmpdir.join('cache')))
+    # the disk cache is only used with locally configured credentials
+    monkeypatch.delenv('AWS_ACCESS_KEY_ID', raising=False)
+    monkeypatch.setenv('AWS_SHARED_CREDENTIALS_FILE', str(tmpdir.join('credentials')))
+    senza.cache.configure()
+    senza.cache.clear()
+    senza.route53.clear()
+    senza.connections.clear()
@@ -1,7 +1,11 @@
 from unittest.mock import MagicMock
+import pytest
 from senza.aws import resolve_topic_arn
+from senza import connections
 import boto.ec2
-from senza.aws import get_security_group, resolve_security_groups, get_account_id, get_account_alias
+import boto.exception
+from senza.aws import get_security_group, resolve_security_groups, get_account_id, get_account_alias, retry_throttled, \
+    get_stacks, StackReference
 
 def test_resolve_security_groups(monkeypatch):
     ec2 = MagicMock()
@@ -37,6 +41,8 @@ def test_get_account_id(monkeypatch):
 
     assert '0123456789' == get_account_id()
 
+    # the IAM client is shared, forget it to use the next mock
+    connections.clear()
     boto3 = MagicMock()
     boto3.get_user.side_effect = Exception()
     boto3.list_roles.return_value = {'Roles': [{'Arn': 'arn:aws:iam::0123456789:role/role-test'}]}
@@ -44,6 +50,7 @@ def test_get_account_id(monkeypatch):
 
     assert '0123456789' == get_account_id()
 
+    connections.clear()
     boto3 = MagicMock()
     boto3.get_user.side_effect = Exception()
     boto3.list_roles.return_value = {'Roles': []}
@@ -52,6 +59,7 @@ def test_get_account_id(monkeypatch):
 
     assert '0123456789' == get_account_id()
 
+    connections.clear()
     boto3 = MagicMock()
     boto3.get_user.side_effect = Exception()
     boto3.list_roles.return_value = {'Roles': []}
@@ -61,6 +69,7 @@ def test_get_account_id(monkeypatch):
 
     assert '0123456789' == get_account_id()
 
+    connections.clear()
     boto3 = MagicMock()
     boto3.get_user.side_effect = Exception()
     boto3.list_roles.return_value = {'Roles': []}
@@ -77,3 +86,92 @@ def test_get_account_alias(monkeypatch):
     monkeypatch.setattr('boto3.client', MagicMock(return_value=boto3))
 
     assert 'org-dummy' == get_account_alias()
+
+
+def test_retry_throttled(monkeypatch):
+    sleep = MagicMock()
+    monkeypatch.setattr('time.sleep', sleep)
+    throttled = boto.exception.BotoServerError(400, 'Bad Request', {'Error': {'Code': 'Throttling'}})
+    func = MagicMock(side_effect=[throttled, throttled, 'result'])
+
+    assert 'result' == retry_throttled(func)('arg')
+    assert sleep.call_count == 2
+    func.assert_called_with('arg')
+
+    func = MagicMock(side_effect=throttled)
+    with pytest.raises(boto.exception.BotoServerError):
+        retry_throttled(func, max_tries=3)()
+    assert func.call_count == 3
+
+    other = boto.exception.BotoServerError(400, 'Bad Request', {'Error': {'Code': 'ValidationError'}})
+    func = MagicMock(side_effect=other)
+    with pytest.raises(boto.exception.BotoServerError):
+        retry_throttled(func)()
+    assert func.call_count == 1
+
+
+def test_resolve_security_groups_index(monkeypatch):
+    ec2 = MagicMock()
+    ec2.get_all_security_groups.return_value = [boto.ec2.securitygroup.SecurityGroup(name='app-a', id='sg-a'),
+                                                boto.ec2.securitygroup.SecurityGroup(name='app-b', id='sg-b')]
+    monkeypatch.setattr('boto.ec2.connect_to_region', MagicMock(return_value=ec2))
+
+    assert ['sg-a', 'sg-b'] == resolve_security_groups(['app-a', 'app-b'], 'myregion')
+    assert ['sg-b'] == resolve_security_groups(['app-b'], 'myregion')
+    assert ec2.get_all_security_groups.call_count == 1
+
+    # unknown names trigger a refresh of the index
+    ec2.get_all_security_groups.return_value.append(boto.ec2.securitygroup.SecurityGroup(name='app-c', id='sg-c'))
+    assert ['sg-c'] == resolve_security_groups(['app-c'], 'myregion')
+    assert ec2.get_all_security_groups.call_count == 2
+
+    with pytest.raises(ValueError):
+        resolve_security_groups(['app-missing'], 'myregion')
+
+
+def test_get_stacks_paginated(monkeypatch):
+    class Page(list):
+        def __init__(self, stacks, next_token):
+            super().__init__(stacks)
+            self.next_token = next_token
+
+    def stack(name):
+        return MagicMock(stack_name=name)
+
+    pages = {None: Page([stack('app-1'), stack('other-1')], 'token-1'),
+             'token-1': Page([stack('app-2')], None)}
+    cf = MagicMock()
+    cf.list_stacks.side_effect = lambda stack_status_filters, next_token=None: pages[next_token]
+    monkeypatch.setattr('boto.cloudformation.connect_to_region', lambda region: cf)
+
+    stacks = get_stacks([StackReference(name='app', version=None)], 'myregion')
+    assert 'app-1' == next(stacks).stack_name
+    # the second page is only requested when needed
+    assert 1 == cf.list_stacks.call_count
+    assert ['app-2'] == [s.stack_name for s in stacks]
+    assert 2 == cf.list_stacks.call_count
+    assert not cf.describe_stacks.called
+
+
+def test_get_stacks_exact(monkeypatch):
+    def describe_stacks(stack_name_or_id):
+        if stack_name_or_id == 'app-2':
+            raise boto.exception.BotoServerError(400, 'Bad Request', {'Error': {
+                'Code': 'ValidationError', 'Message': 'Stack with id app-2 does not exist'}})
+        return [MagicMock(stack_name=stack_name_or_id, description='My App', spec=['stack_name', 'description'])]
+    cf = MagicMock()
+    cf.describe_stacks.side_effect = describe_stacks
+    monkeypatch.setattr('boto.cloudformation.connect_to_region', lambda region: cf)
+
+    refs = [StackReference(name='app', version='1'), StackReference(name='app', version='2'),
+            StackReference(name='app', version='1')]
+    stacks = list(get_stacks(refs, 'myregion'))
+    assert ['app-1'] == [s.stack_name for s in stacks]
+    assert 'My App' == stacks[0].template_description
+    assert 2 == cf.describe_stacks.call_count
+    assert not cf.list_stacks.called
+
+    # deleted stacks can only be found by listing them
+    cf.list_stacks.return_value = []
+    assert [] == list(get_stacks(refs, 'myregion', all=True))
+    assert cf.list_stacks.called
@@ -0,0 +1,90 @@
+import os
+from unittest.mock import MagicMock
+import senza.cache
+from senza.cache import get_or_fetch, get_account_id, clear, configure, get_credentials_id
+
+
+def test_get_or_fetch_memory(monkeypatch):
+    monkeypatch.setattr('senza.cache.get_credentials_id', lambda: None)
+    fetch = MagicMock(return_value={'a': 'b'})
+
+    assert get_or_fetch('myregion', 'things', 60, fetch) == {'a': 'b'}
+    assert get_or_fetch('myregion', 'things', 60, fetch) == {'a': 'b'}
+    assert fetch.call_count == 1
+
+    assert get_or_fetch('otherregion', 'things', 60, fetch) == {'a': 'b'}
+    assert fetch.call_count == 2
+
+    get_or_fetch('myregion', 'things', 60, fetch, refresh=True)
+    assert fetch.call_count == 3
+    assert senza.cache.stats == {'hits': 1, 'misses': 3}
+
+
+def test_get_or_fetch_disk(monkeypatch):
+    monkeypatch.setattr('senza.cache.get_credentials_id', lambda: 'cred123')
+    fetch_account_id = MagicMock(return_value='123456789')
+    monkeypatch.setattr('senza.aws.get_account_id', fetch_account_id)
+    fetch = MagicMock(return_value=['x'])
+
+    assert get_or_fetch('myregion', 'things', 60, fetch) == ['x']
+    cache_dir = os.environ['SENZA_CACHE_DIR']
+    assert os.path.exists(os.path.join(cache_dir, '123456789', 'myregion', 'things.json'))
+    assert os.path.exists(os.path.join(cache_dir, 'credentials', 'cred123.json'))
+
+    # new process: in-memory cache is empty, but the files are still valid
+    clear()
+    assert get_or_fetch('myregion', 'things', 60, fetch) == ['x']
+    assert get_account_id() == '123456789'
+    assert fetch.call_count == 1
+    assert fetch_account_id.call_count == 1
+
+    # expired
+    clear()
+    assert get_or_fetch('myregion', 'things', -1, fetch) == ['x']
+    assert fetch.call_count == 2
+
+    # --refresh-cache
+    clear()
+    configure(refresh=True)
+    get_or_fetch('myregion', 'things', 60, fetch)
+    get_or_fetch('myregion', 'things', 60, fetch)
+    assert fetch.call_count == 3
+
+    # --no-cache
+    clear()
+    configure(enabled=False)
+    get_or_fetch('myregion', 'things', 60, fetch)
+    assert fetch.call_count == 4
+
+    # SENZA_NO_CACHE
+    clear()
+    configure()
+    monkeypatch.setenv('SENZA_NO_CACHE', '1')
+    get_or_fetch('myregion', 'things', 60, fetch)
+    assert fetch.call_count == 5
+
+
+def test_get_credentials_id(monkeypatch, tmpdir):
+    assert get_credentials_id() is None
+
+    credentials = tmpdir.join('credentials')
+    credentials.write('[default]\naws_access_key_id = AKIA789\n')
+    monkeypatch.setenv('AWS_SHARED_CREDENTIALS_FILE', str(credentials))
+    from_file = get_credentials_id()
+
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'AKIA123')
+    first = get_credentials_id()
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'AKIA456')
+    assert first and from_file and len(set([first, from_file, get_credentials_id()])) == 3
+    assert 'AKIA' not in first
+
+
+def test_get_credentials_id_invalid_file(monkeypatch, tmpdir):
+    credentials = tmpdir.join('credentials')
+    monkeypatch.setenv('AWS_SHARED_CREDENTIALS_FILE', str(credentials))
+    for content in ('[default]\naws_secret_access_key = secret\n', 'no section\n', '[default\n'):
+        credentials.write(content)
+        assert get_credentials_id() is None
+    monkeypatch.setenv('AWS_PROFILE', 'unknown')
+    credentials.write('[default]\naws_access_key_id = AKIA789\n')
+    assert get_credentials_id() is None
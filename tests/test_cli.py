@@ -1,10 +1,14 @@
+import base64
 import datetime
+import json
 import os
 from click.testing import CliRunner
 import collections
 from unittest.mock import MagicMock, Mock
 import yaml
-from senza.cli import cli, handle_exceptions, AccountArguments
+import click
+import pytest
+from senza.cli import cli, handle_exceptions, AccountArguments, get_region
 import boto.exception
 from senza.traffic import PERCENT_RESOLUTION, StackVersion
 
@@ -211,6 +215,16 @@ def test_print_auto(monkeypatch):
     assert 'subnet-123' in result.output
     assert 'source: foo/bar:1.0-SNAPSHOT' in result.output
     assert '"HealthCheckType": "ELB"' in result.output
+    assert 'AWS metadata cache: ' in result.output
+
+    with runner.isolated_filesystem():
+        with open('myapp.yaml', 'w') as fd:
+            yaml.dump(data, fd)
+
+        result = runner.invoke(cli, ['print', 'myapp.yaml', '--region=myregion', '123', '1.0-SNAPSHOT', '--no-cache'],
+                               catch_exceptions=False)
+
+    assert '"HealthCheckType": "ELB"' in result.output
 
 
 def test_print_default_value(monkeypatch):
@@ -367,6 +381,64 @@ def test_instances(monkeypatch):
     assert 'Launched' in result.output
 
 
+def test_instances_health_once_per_stack(monkeypatch):
+    stack = MagicMock(stack_name='test-1')
+    instances = []
+    for instance_id in ('i-1', 'i-2', 'i-3'):
+        inst = MagicMock(id=instance_id, state='running', launch_time='2015-04-14T19:09:01.000Z')
+        inst.tags = {'aws:cloudformation:stack-name': 'test-1', 'StackName': 'test', 'StackVersion': '1'}
+        instances.append(inst)
+    elb = MagicMock()
+    elb.describe_instance_health.return_value = [MagicMock(instance_id='i-2', state='InService')]
+    monkeypatch.setattr('boto.ec2.connect_to_region',
+                        lambda x: MagicMock(get_only_instances=lambda filters: instances))
+    monkeypatch.setattr('boto.cloudformation.connect_to_region',
+                        lambda x: MagicMock(list_stacks=lambda stack_status_filters: [stack]))
+    monkeypatch.setattr('boto.ec2.elb.connect_to_region', lambda x: elb)
+    monkeypatch.setattr('boto.iam.connect_to_region', lambda x: MagicMock())
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ['instances', 'test', '--region=myregion'], catch_exceptions=False)
+
+    assert 'IN_SERVICE' in result.output
+    elb.describe_instance_health.assert_called_once_with('test-1')
+
+
+def test_instances_docker_image_by_launch_configuration(monkeypatch):
+    instances = []
+    for instance_id, group in (('i-1', 'asg-1'), ('i-2', 'asg-1'), ('i-3', None)):
+        inst = MagicMock(id=instance_id, state='running', launch_time='2015-04-14T19:09:01.000Z')
+        inst.tags = {'aws:cloudformation:stack-name': 'test-1', 'StackName': 'test', 'StackVersion': '1',
+                     'aws:autoscaling:groupName': group}
+        instances.append(inst)
+    instances[2].get_attribute.return_value = {'userData': base64.b64encode(b'source: foo/single:2.0').decode()}
+    autoscale = MagicMock()
+    autoscale.get_all_groups.return_value = [
+        MagicMock(instances=[MagicMock(instance_id=instance_id, launch_config_name='lc-1')
+                             for instance_id in ('i-1', 'i-2')])]
+    lc = MagicMock(user_data=b'#taupage-ami-config\nsource: "foo/asg:1.0"\n')
+    lc.name = 'lc-1'
+    autoscale.get_all_launch_configurations.return_value = [lc]
+    monkeypatch.setattr('boto.ec2.connect_to_region',
+                        lambda x: MagicMock(get_only_instances=lambda filters: instances))
+    monkeypatch.setattr('boto.cloudformation.connect_to_region', lambda x: MagicMock())
+    monkeypatch.setattr('boto.ec2.elb.connect_to_region',
+                        lambda x: MagicMock(describe_instance_health=lambda stack: []))
+    monkeypatch.setattr('boto.ec2.autoscale.connect_to_region', lambda x: autoscale)
+    monkeypatch.setattr('boto.iam.connect_to_region', lambda x: MagicMock())
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ['instances', 'test', '--region=myregion', '-d', '-o', 'tsv'],
+                           catch_exceptions=False)
+
+    lines = result.output.strip().split('\n')
+    assert ['foo/asg:1.0', 'foo/asg:1.0', 'foo/single:2.0'] == [line.split('\t')[8] for line in lines[1:]]
+    autoscale.get_all_groups.assert_called_once_with(names=['asg-1'])
+    autoscale.get_all_launch_configurations.assert_called_once_with(names=['lc-1'])
+    assert not instances[0].get_attribute.called
+    instances[2].get_attribute.assert_called_once_with('userData')
+
+
 def test_console(monkeypatch):
     stack = MagicMock(stack_name='test-1')
     inst = MagicMock()
@@ -427,12 +499,81 @@ def test_status(monkeypatch):
     assert 'Running' in result.output
 
 
+def test_status_parallel(monkeypatch):
+    stacks = [MagicMock(stack_name='test-{}'.format(i), stack_id='id-{}'.format(i), stack_status='CREATE_COMPLETE')
+              for i in range(5)]
+    instances = [MagicMock(state='running', tags={'aws:cloudformation:stack-id': 'id-{}'.format(i % 2)})
+                 for i in range(3)]
+    ec2 = MagicMock()
+    ec2.get_only_instances.return_value = instances
+    monkeypatch.setattr('boto.ec2.connect_to_region', lambda x: ec2)
+    monkeypatch.setattr('boto.cloudformation.connect_to_region',
+                        lambda x: MagicMock(list_stacks=lambda stack_status_filters: stacks,
+                                            describe_stack_resources=lambda stack_id: []))
+    monkeypatch.setattr('boto.ec2.elb.connect_to_region',
+                        lambda x: MagicMock(describe_instance_health=lambda stack: []))
+    monkeypatch.setattr('boto.iam.connect_to_region', lambda x: MagicMock())
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ['status', 'test', '--region=myregion', '--parallelism=3', '-o', 'tsv'],
+                           catch_exceptions=False)
+
+    lines = result.output.strip().split('\n')
+    assert [line.split('\t')[1] for line in lines[1:]] == ['0', '1', '2', '3', '4']
+    assert [line.split('\t')[3] for line in lines[1:]] == ['2', '1', '0', '0', '0']
+    # a single DescribeInstances call serves all stack rows
+    ec2.get_only_instances.assert_called_once_with(filters={'tag-key': 'aws:cloudformation:stack-id'})
+
+
+def test_status_watch_traffic(monkeypatch):
+    stack = MagicMock(stack_name='test-1', stack_id='id-1', stack_status='CREATE_COMPLETE')
+    domain = MagicMock(resource_type='AWS::Route53::RecordSet', logical_resource_id='MainDomain',
+                       physical_resource_id='test.example.org')
+    cf = MagicMock(list_stacks=lambda stack_status_filters: [stack])
+    cf.describe_stack_resources.return_value = [domain]
+    monkeypatch.setattr('boto.cloudformation.connect_to_region', lambda x: cf)
+    monkeypatch.setattr('boto.ec2.connect_to_region', lambda x: MagicMock(get_only_instances=lambda filters: []))
+    monkeypatch.setattr('boto.ec2.elb.connect_to_region',
+                        lambda x: MagicMock(describe_instance_health=lambda stack: []))
+    monkeypatch.setattr('boto.iam.connect_to_region', lambda x: MagicMock())
+
+    zone = MagicMock(id='zone-1', resourcerecordsetcount='1')
+    zone.name = 'example.org.'
+    record = MagicMock(type='CNAME', identifier='test-1', weight='200', resource_records=['test-1-123.elb'])
+    record.name = 'test.example.org.'
+    route53 = MagicMock()
+    route53.get_zones.side_effect = lambda: [zone]
+    route53.get_all_rrsets.side_effect = lambda zone_id, maxitems: [record]
+    monkeypatch.setattr('boto.route53.connect_to_region', lambda x: route53)
+
+    class StopWatching(Exception):
+        pass
+
+    def sleep(secs):
+        if record.weight == '0':
+            raise StopWatching()
+        # traffic is switched to another stack version between the refreshes
+        record.weight = '0'
+        zone.resourcerecordsetcount = '2'
+
+    monkeypatch.setattr('time.sleep', sleep)
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ['status', 'test', '--region=myregion', '-W', '-o', 'tsv'])
+
+    assert isinstance(result.exception, StopWatching)
+    # the traffic is checked again, the stack's resources are reused
+    assert ['yes', 'no'] == [line.split('\t')[-1] for line in result.output.splitlines()
+                             if line.startswith('test\t')]
+    cf.describe_stack_resources.assert_called_once_with('id-1')
+
+
 def test_resources(monkeypatch):
     stack = MagicMock(stack_name='test-1', creation_time=datetime.datetime.now())
     res = MagicMock(timestamp=datetime.datetime.now(), logical_resource_id='MyTestResource', resource_type='AWS::abc')
     monkeypatch.setattr('boto.cloudformation.connect_to_region',
                         lambda x: MagicMock(describe_stack_resources=lambda x: [res],
-                                            list_stacks=lambda stack_status_filters: [stack]))
+                                            describe_stacks=lambda stack_name_or_id: [stack]))
     monkeypatch.setattr('boto.iam.connect_to_region', lambda x: MagicMock())
 
     runner = CliRunner()
@@ -453,11 +594,16 @@ def test_domains(monkeypatch):
     res = MagicMock(timestamp=datetime.datetime.now(), logical_resource_id='MyTestResource',
                     physical_resource_id='mydomain.example.org',
                     resource_type='AWS::Route53::RecordSet')
+    zone = MagicMock(id='zone-1')
+    zone.name = 'example.org.'
+    record = MagicMock(type='CNAME', identifier='test-1', weight='200', resource_records=['test-1.elb.amazonaws.com'])
+    record.name = 'mydomain.example.org.'
     route53 = MagicMock()
-    route53.get_zone.return_value.get_records.return_value = [MagicMock()]
+    route53.get_zones.return_value = [zone]
+    route53.get_all_rrsets.return_value = [record]
     monkeypatch.setattr('boto.cloudformation.connect_to_region',
                         lambda x: MagicMock(describe_stack_resources=lambda x: [res],
-                                            list_stacks=lambda stack_status_filters: [stack]))
+                                            describe_stacks=lambda stack_name_or_id: [stack]))
     monkeypatch.setattr('boto.route53.connect_to_region', lambda x: route53)
     monkeypatch.setattr('boto.iam.connect_to_region', lambda x: MagicMock())
 
@@ -472,6 +618,7 @@ def test_domains(monkeypatch):
                                catch_exceptions=False)
 
     assert 'mydomain.example.org' in result.output
+    assert 'test-1.elb.amazonaws.com' in result.output
 
 
 def test_events(monkeypatch):
@@ -479,7 +626,7 @@ def test_events(monkeypatch):
     evt = MagicMock(timestamp=datetime.datetime.now(), logical_resource_id='MyTestEventRes', resource_type='foobar')
     monkeypatch.setattr('boto.cloudformation.connect_to_region',
                         lambda x: MagicMock(describe_stack_events=lambda x: [evt],
-                                            list_stacks=lambda stack_status_filters: [stack]))
+                                            describe_stacks=lambda stack_name_or_id: [stack]))
     monkeypatch.setattr('boto.iam.connect_to_region', lambda x: MagicMock())
 
     runner = CliRunner()
@@ -514,6 +661,31 @@ def test_list(monkeypatch):
     assert 'test-stack' in result.output
 
 
+def test_list_stream(monkeypatch):
+    stacks = [MagicMock(stack_name='b-stack-1', stack_status='CREATE_COMPLETE', template_description='B',
+                        creation_time=datetime.datetime(2015, 1, 1)),
+              MagicMock(stack_name='a-stack-1', stack_status='CREATE_COMPLETE', template_description='A',
+                        creation_time=datetime.datetime(2015, 1, 1))]
+    monkeypatch.setattr('boto.cloudformation.connect_to_region',
+                        lambda x: MagicMock(list_stacks=lambda stack_status_filters: stacks))
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ['list', '--region=myregion', '-o', 'json', '--stream'], catch_exceptions=False)
+    # JSON lines in the order the stacks arrived (not sorted)
+    rows = [json.loads(line) for line in result.output.splitlines()]
+    assert ['b-stack', 'a-stack'] == [row['stack_name'] for row in rows]
+    assert 1420070400 == rows[0]['creation_time']
+
+    result = runner.invoke(cli, ['list', '--region=myregion', '-o', 'tsv', '--stream'], catch_exceptions=False)
+    lines = result.output.splitlines()
+    assert 'stack_name\tversion\tstatus\tcreation_time\tdescription' == lines[0]
+    assert lines[1].startswith('b-stack\t1\tCREATE_COMPLETE\t')
+
+    result = runner.invoke(cli, ['list', '--region=myregion', '--stream'])
+    assert 'requires the "tsv" or "json" output format' in result.output
+    assert 2 == result.exit_code
+
+
 def test_images(monkeypatch):
     image = MagicMock()
     image.id = 'ami-123'
@@ -547,9 +719,68 @@ def test_images(monkeypatch):
     assert 'mystack' in result.output
 
 
+def test_images_targeted(monkeypatch):
+    image = MagicMock(id='ami-456', owner_id='123', description='Taupage',
+                      creationDate=(datetime.datetime.utcnow() - datetime.timedelta(days=30)).isoformat('T') + 'Z')
+    image.name = 'OldImage'
+
+    instance = MagicMock(id='i-777', image_id='ami-456', state='running',
+                         tags={'aws:cloudformation:stack-name': 'mystack-1'})
+
+    ec2 = MagicMock()
+    ec2.get_all_images.return_value = [image]
+    ec2.get_only_instances.return_value = [instance]
+    monkeypatch.setattr('boto.cloudformation.connect_to_region', lambda x: MagicMock())
+    monkeypatch.setattr('boto.ec2.connect_to_region', lambda x: ec2)
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ['images', 'mystack', '--region=myregion', '-o', 'tsv'], catch_exceptions=False)
+    assert 'ami-456\tOldImage\t123\tTaupage\tmystack-1\t1' in result.output
+
+    filters = ec2.get_only_instances.call_args[1]['filters']
+    assert ['mystack-*'] == filters['tag:aws:cloudformation:stack-name']
+    assert 'terminated' not in filters['instance-state-name']
+    # only the images of the stack's instances are described (no Taupage catalogue)
+    ec2.get_all_images.assert_called_once_with(filters={'image-id': ['ami-456']})
+
+    # the Taupage catalogue is cached
+    ec2.get_all_images.reset_mock()
+    runner.invoke(cli, ['images', '--region=myregion'], catch_exceptions=False)
+    runner.invoke(cli, ['images', '--region=myregion'], catch_exceptions=False)
+    assert [{'filters': {'name': '*Taupage-*', 'state': 'available'}}] == \
+        [kwargs for args, kwargs in ec2.get_all_images.call_args_list]
+
+
+def test_images_deregistered(monkeypatch):
+    image = MagicMock(id='ami-456', owner_id='123', description='Taupage',
+                      creationDate=(datetime.datetime.utcnow() - datetime.timedelta(days=30)).isoformat('T') + 'Z')
+    image.name = 'OldImage'
+
+    instances = [MagicMock(id='i-777', image_id='ami-456', state='running',
+                           tags={'aws:cloudformation:stack-name': 'mystack-1'}),
+                 MagicMock(id='i-888', image_id='ami-deregistered', state='running',
+                           tags={'aws:cloudformation:stack-name': 'mystack-1'})]
+
+    ec2 = MagicMock()
+    # the "image-id" filter skips AMIs which do not exist anymore
+    ec2.get_all_images.side_effect = lambda filters: [img for img in [image] if img.id in filters['image-id']]
+    ec2.get_only_instances.return_value = instances
+    monkeypatch.setattr('boto.cloudformation.connect_to_region', lambda x: MagicMock())
+    monkeypatch.setattr('boto.ec2.connect_to_region', lambda x: ec2)
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ['images', 'mystack', '--region=myregion', '-o', 'tsv'], catch_exceptions=False)
+    assert 0 == result.exit_code
+    assert 'ami-456\tOldImage\t123\tTaupage\tmystack-1\t1' in result.output
+    assert 'ami-deregistered' not in result.output
+    ec2.get_all_images.assert_called_once_with(filters={'image-id': ['ami-456', 'ami-deregistered']})
+
+
 def test_delete(monkeypatch):
     cf = MagicMock()
     stack = MagicMock(stack_name='test-1')
+    # a single stack version is described directly, all versions are listed
+    cf.describe_stacks.return_value = [stack]
     cf.list_stacks.return_value = [stack]
     monkeypatch.setattr('boto.cloudformation.connect_to_region', lambda x: cf)
     monkeypatch.setattr('boto.iam.connect_to_region', lambda x: MagicMock())
@@ -645,7 +876,14 @@ def test_create(monkeypatch):
         assert 'Positional parameters must not follow keywords' in result.output
 
 
-def test_traffic(monkeypatch):
+@pytest.mark.parametrize('opts, expected', [
+    # exact apportionment (default)
+    ([], [[0, 0, 0, 200], [0, 0, 20, 180], [0, 1, 19, 180], [2, 1, 18, 179], [1, 1, 8, 190], [0, 0, 0, 200],
+          [0, 0, 0, 200], [0, 0, 0, 0]]),
+    (['--legacy-weights'], [[0, 0, 0, 200], [0, 0, 20, 180], [0, 1, 20, 179], [2, 1, 19, 178], [1, 1, 13, 185],
+                            [0, 0, 0, 200], [0, 0, 0, 200], [0, 0, 0, 0]]),
+])
+def test_traffic(monkeypatch, opts, expected):
     r53conn = Mock(name='r53conn')
 
     monkeypatch.setattr('boto.ec2.connect_to_region', MagicMock())
@@ -672,6 +910,9 @@ def test_traffic(monkeypatch):
         rec.name = 'myapp.example.org.'
         return rec
 
+    zone = MagicMock(id='zone-1')
+    zone.name = 'example.org.'
+    r53conn().get_zones.return_value = [zone]
     rr = MagicMock()
     records = collections.OrderedDict()
 
@@ -682,8 +923,6 @@ def test_traffic(monkeypatch):
         dns_identifier = 'myapp-{}'.format(ver)
         records[dns_identifier] = record(dns_identifier, percentage * PERCENT_RESOLUTION)
 
-    rr.__iter__ = lambda x: iter(records.values())
-
     def add_change(op, dns_name, rtype, ttl, identifier, weight):
         if op == 'CREATE':
             x = MagicMock(weight=weight, identifier=identifier)
@@ -701,43 +940,40 @@ def test_traffic(monkeypatch):
     rr.add_change = add_change
     rr.add_change_record = add_change_record
 
-    r53conn().get_zone().get_records.return_value = rr
+    # records are read from the zone again after every change
+    r53conn().get_all_rrsets.side_effect = lambda zone_id, maxitems: list(records.values())
+    monkeypatch.setattr('boto.route53.record.ResourceRecordSets', lambda connection, zone_id: rr)
 
     runner = CliRunner()
 
     common_opts = ['traffic', '--region=my-region', 'myapp']
 
-    def run(opts):
-        result = runner.invoke(cli, common_opts + opts, catch_exceptions=False)
+    def run(args):
+        result = runner.invoke(cli, common_opts + args + opts, catch_exceptions=False)
         return result
 
     def weights():
         return [r.weight for r in records.values()]
 
     with runner.isolated_filesystem():
-        run(['v4', '100'])
-        assert weights() == [0, 0, 0, 200]
-
-        run(['v3', '10'])
-        assert weights() == [0, 0, 20, 180]
-
-        run(['v2', '0.5'])
-        assert weights() == [0, 1, 20, 179]
-
-        run(['v1', '1'])
-        assert weights() == [2, 1, 19, 178]
+        actual = []
+        for args in [['v4', '100'], ['v3', '10'], ['v2', '0.5'], ['v1', '1'], ['v4', '95'], ['v4', '100'],
+                     ['v4', '10'], ['v4', '0']]:
+            run(args)
+            actual.append(weights())
+        assert expected == actual
 
-        run(['v4', '95'])
-        assert weights() == [1, 1, 13, 185]
 
-        run(['v4', '100'])
-        assert weights() == [0, 0, 0, 200]
-
-        run(['v4', '10'])
-        assert weights() == [0, 0, 0, 200]
+def test_traffic_steps():
+    runner = CliRunner()
+    for steps in ('5,50,25,100', '50,10,60', '5,5,10'):
+        result = runner.invoke(cli, ['traffic', 'myapp', 'v2', '--steps', steps])
+        assert 'Steps must be strictly increasing or strictly decreasing' in result.output
+        assert 2 == result.exit_code
 
-        run(['v4', '0'])
-        assert weights() == [0, 0, 0, 0]
+    result = runner.invoke(cli, ['traffic', 'myapp', 'v2', '--steps', '1,x'])
+    assert 'Steps must be a comma separated list of percentages' in result.output
+    assert 2 == result.exit_code
 
 
 def test_AccountArguments(monkeypatch):
@@ -757,3 +993,135 @@ def test_AccountArguments(monkeypatch):
     assert test.AccountID == '98741256325'
     assert test.Domain == 'test.example.net'
     assert test.TeamID == 'cli'
+
+
+def test_resources_watch_incremental(monkeypatch):
+    stacks = [MagicMock(stack_name='test-{}'.format(i), stack_id='id-{}'.format(i), stack_status='CREATE_COMPLETE')
+              for i in range(2)]
+    res = MagicMock(timestamp=datetime.datetime.now(), logical_resource_id='MyTestResource', resource_type='AWS::abc')
+    cf = MagicMock(list_stacks=lambda stack_status_filters: stacks)
+    cf.describe_stack_resources.side_effect = lambda stack_name: [res]
+    monkeypatch.setattr('boto.cloudformation.connect_to_region', lambda x: cf)
+    monkeypatch.setattr('boto.iam.connect_to_region', lambda x: MagicMock())
+
+    class StopWatching(Exception):
+        pass
+
+    ticks = []
+
+    def sleep(secs):
+        if len(ticks) == 2:
+            raise StopWatching()
+        # the second stack is being updated after the first refresh
+        stacks[1].stack_status = 'UPDATE_IN_PROGRESS'
+        ticks.append(secs)
+
+    monkeypatch.setattr('time.sleep', sleep)
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ['resources', 'test', '--region=myregion', '-W'])
+
+    assert isinstance(result.exception, StopWatching)
+    assert 'MyTestResource' in result.output
+    # the unchanged stack is only fetched once, the stack in progress on every refresh
+    assert ['test-0', 'test-1', 'test-1', 'test-1'] == [c[0][0] for c in cf.describe_stack_resources.call_args_list]
+
+
+def test_events_tail(monkeypatch):
+    stack = MagicMock(stack_name='test-1', stack_id='id-1', stack_status='CREATE_IN_PROGRESS')
+    now = datetime.datetime.utcnow()
+
+    def event(event_id, resource_type, status, physical_resource_id='x'):
+        return MagicMock(event_id=event_id, timestamp=now, resource_type=resource_type,
+                         logical_resource_id='Res{}'.format(event_id), resource_status=status,
+                         resource_status_reason=None, physical_resource_id=physical_resource_id)
+
+    class Page(list):
+        next_token = None
+
+    first = Page([event('e2', 'AWS::IAM::Role', 'CREATE_IN_PROGRESS'),
+                  event('e1', 'AWS::CloudFormation::Stack', 'CREATE_IN_PROGRESS', 'id-1')])
+    newer = Page([event('e4', 'AWS::CloudFormation::Stack', 'CREATE_COMPLETE', 'id-1'),
+                  event('e3', 'AWS::IAM::Role', 'CREATE_COMPLETE')])
+    newer.next_token = 'page-2'
+    older = Page([first[0]] + list(first))
+
+    cf = MagicMock(list_stacks=lambda stack_status_filters: [stack])
+    cf.describe_stack_events.side_effect = [first, newer, older]
+    monkeypatch.setattr('boto.cloudformation.connect_to_region', lambda x: cf)
+    monkeypatch.setattr('boto.iam.connect_to_region', lambda x: MagicMock())
+    monkeypatch.setattr('time.sleep', MagicMock())
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ['events', 'test', '--region=myregion', '--tail', '-o', 'tsv'],
+                           catch_exceptions=False)
+
+    lines = result.output.strip().split('\n')
+    assert lines[0].startswith('stack_name\t')
+    # events are appended oldest first, each only once
+    assert ['Rese1', 'Rese2', 'Rese3', 'Rese4'] == [line.split('\t')[3] for line in lines[1:]]
+    # timestamps are formatted like with --stream
+    assert all(line.split('\t')[6].endswith(' ago') for line in lines[1:])
+    # paged until the last seen event, stopped after the stack reached CREATE_COMPLETE
+    assert [('id-1', None), ('id-1', None), ('id-1', 'page-2')] == \
+        [c[0] for c in cf.describe_stack_events.call_args_list]
+
+
+def test_console_watch(monkeypatch):
+    instances = [MagicMock(id='i-{}'.format(i), private_ip_address='172.31.1.{}'.format(i),
+                           tags={'aws:cloudformation:stack-name': 'test-1'}) for i in (2, 1)]
+    outputs = {'i-1': [b'a\nb\n', b'a\nb\nc\npart'], 'i-2': [b'x\n', b'x\n']}
+    ec2 = MagicMock()
+    ec2.get_only_instances.return_value = instances
+    ec2.get_console_output.side_effect = lambda instance_id: MagicMock(output=outputs[instance_id].pop(0))
+    monkeypatch.setattr('boto.ec2.connect_to_region', lambda x: ec2)
+    monkeypatch.setattr('boto.cloudformation.connect_to_region', lambda x: MagicMock())
+    monkeypatch.setattr('boto.iam.connect_to_region', lambda x: MagicMock())
+
+    class StopWatching(Exception):
+        pass
+
+    ticks = []
+
+    def sleep(secs):
+        if ticks:
+            raise StopWatching()
+        ticks.append(secs)
+
+    monkeypatch.setattr('time.sleep', sleep)
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ['console', 'test', '--region=myregion', '-W'])
+
+    assert isinstance(result.exception, StopWatching)
+    # ordered by instance, only new and complete lines are printed on refresh
+    assert ['Showing last 25 lines of 172.31.1.1..', 'a', 'b',
+            'Showing last 25 lines of 172.31.1.2..', 'x',
+            'New console output of 172.31.1.1..', 'c'] == result.output.rstrip('\n').split('\n')
+
+
+def test_expired_credentials_boto3(capsys):
+    import botocore.exceptions
+    func = MagicMock(side_effect=botocore.exceptions.ClientError(
+        {'Error': {'Code': 'ExpiredToken', 'Message': 'The security token included in the request is expired'}},
+        'GetUser'))
+
+    try:
+        handle_exceptions(func)()
+    except SystemExit:
+        pass
+
+    out, err = capsys.readouterr()
+    assert 'AWS credentials have expired.' in err
+
+
+def test_get_region_without_connecting(monkeypatch):
+    connect = MagicMock(return_value=None)
+    monkeypatch.setattr('boto.cloudformation.connect_to_region', connect)
+
+    assert 'eu-west-1' == get_region('eu-west-1')
+    assert not connect.called
+
+    with pytest.raises(click.UsageError):
+        get_region('unknown-region')
+    connect.assert_called_once_with('unknown-region')
@@ -1,6 +1,9 @@
 import click
+import yaml
 from unittest.mock import MagicMock
-from senza.components import get_component
+from senza.cli import TemplateArguments
+from senza.components import get_component, evaluate_template
+from senza.utils import pystache_render
 from senza.components.iam_role import component_iam_role, get_merged_policies
 from senza.components.elastic_load_balancer import component_elastic_load_balancer
 from senza.components.weighted_dns_elastic_load_balancer import component_weighted_dns_elastic_load_balancer
@@ -12,6 +15,29 @@ def test_invalid_component():
     assert get_component('Foobar') is None
 
 
+def test_evaluate_template():
+    definition = {'Resources': {'{{SenzaInfo.StackName}}Role': {'Type': 'AWS::IAM::Role'}},
+                  'SenzaComponents': [{'AppServer': {'Type': 'Senza::TaupageAutoScalingGroup',
+                                                     'Ports': [8080, 'x{{Arguments.Port}}'],
+                                                     'TaupageConfig': {
+                                                         'source': 'foo/bar:{{Arguments.ImageVersion}}',
+                                                         'quoted': '"{{Arguments.ImageVersion}}"',
+                                                         'enabled': True,
+                                                         'empty': None}}}],
+                  'Outputs': {'Version': {'Value': '{{SenzaInfo.StackVersion}}'}}}
+    info = {'StackName': 'test', 'StackVersion': '42'}
+    args = TemplateArguments(region='myregion', version='42', ImageVersion='1.0', Port='8080')
+
+    # rendering the structure must give the same result as rendering the serialized YAML document
+    template = yaml.dump(definition, default_flow_style=False)
+    expected = yaml.safe_load(pystache_render(template, {'SenzaInfo': info, 'SenzaComponents': [],
+                                                         'Arguments': args, 'AccountInfo': None}))
+
+    assert expected == evaluate_template(definition, info, [], args, None)
+    assert 'testRole' in expected['Resources']
+    assert 'foo/bar:1.0' == expected['SenzaComponents'][0]['AppServer']['TaupageConfig']['source']
+
+
 def test_component_iam_role(monkeypatch):
     configuration = {
         'Name': 'MyRole',
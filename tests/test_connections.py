@@ -0,0 +1,61 @@
+import ssl
+from unittest.mock import MagicMock
+
+from click.testing import CliRunner
+
+from senza import connections
+from senza.cli import cli
+from senza.connections import get_connection, get_client, stats
+
+
+def test_get_connection(monkeypatch):
+    connect = MagicMock(side_effect=lambda region: None if region == 'unknown' else MagicMock(region=region))
+    monkeypatch.setattr('boto.ec2.connect_to_region', connect)
+
+    conn = get_connection('ec2', 'myregion')
+    assert conn is get_connection('ec2', 'myregion')
+    assert 'otherregion' == get_connection('ec2', 'otherregion').region
+    # unknown regions are not remembered
+    assert get_connection('ec2', 'unknown') is None
+    assert get_connection('ec2', 'unknown') is None
+    assert 4 == connect.call_count
+    assert 2 == stats['connections']
+
+
+def test_get_client(monkeypatch):
+    client = MagicMock(side_effect=lambda service, **kwargs: MagicMock(service=service, kwargs=kwargs))
+    monkeypatch.setattr('boto3.client', client)
+
+    iam = get_client('iam')
+    assert iam is get_client('iam')
+    assert {} == iam.kwargs
+    assert {'region_name': 'myregion'} == get_client('iam', 'myregion').kwargs
+    assert 2 == client.call_count
+
+
+def test_count_tls_handshakes(monkeypatch):
+    calls = []
+
+    def wrap_socket(self, sock):
+        calls.append(sock)
+    monkeypatch.setattr('ssl.SSLContext.wrap_socket', wrap_socket)
+    connections.count_tls_handshakes()
+    # enabling twice does not count twice
+    connections.count_tls_handshakes()
+
+    ssl.SSLContext.wrap_socket(MagicMock(), MagicMock())
+    assert 1 == stats['tls_handshakes']
+    assert 1 == len(calls)
+
+
+def test_debug_option(monkeypatch):
+    monkeypatch.setattr('senza.connections.count_tls_handshakes', MagicMock())
+    cf = MagicMock()
+    cf.list_stacks.return_value = []
+    monkeypatch.setattr('boto.cloudformation.connect_to_region', lambda region: cf)
+    monkeypatch.setattr('boto.iam.connect_to_region', lambda region: MagicMock())
+    monkeypatch.setattr('boto3.client', MagicMock())
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ['--debug', 'list', '--region=myregion'], catch_exceptions=False)
+    assert 'AWS connections: ' in result.output
@@ -0,0 +1,78 @@
+from unittest.mock import MagicMock
+
+from senza.route53 import get_record_index, wait_for_changes, MAX_RECORDS_PER_PAGE
+
+
+def record(name, type, identifier=None, weight=None):
+    rec = MagicMock(type=type, identifier=identifier, weight=weight)
+    rec.name = name
+    return rec
+
+
+def zone(name, zone_id, count):
+    z = MagicMock(id=zone_id, resourcerecordsetcount=count)
+    z.name = name
+    return z
+
+
+def test_record_index(monkeypatch):
+    route53 = MagicMock()
+    route53.get_zones.return_value = [zone('example.org.', 'zone-1', '3'), zone('sub.example.org.', 'zone-2', '1')]
+    records = {'zone-1': [record('example.org.', 'SOA'),
+                          record('app.example.org.', 'CNAME', 'app-1', '100'),
+                          record('app.example.org.', 'CNAME', 'app-2', '100')],
+               'zone-2': [record('Other.Sub.example.org.', 'A')]}
+    route53.get_all_rrsets.side_effect = lambda zone_id, maxitems: records[zone_id]
+    monkeypatch.setattr('boto.route53.connect_to_region', lambda region: route53)
+
+    index = get_record_index('myregion')
+    assert index is get_record_index('myregion')
+
+    assert ['app-1', 'app-2'] == [rec.identifier for rec in index.find('app.example.org', 'CNAME')]
+    assert [] == index.find('app.example.org', 'A')
+    assert 'app-2' == index.get('app.example.org.', 'CNAME', 'app-2').identifier
+    assert index.get('other.sub.example.org', 'A') is records['zone-2'][0]
+    assert index.get('unknown.example.com', 'A') is None
+    assert [] == index.find(None)
+
+    # every zone is listed and read only once
+    route53.get_zones.assert_called_once_with()
+    assert [(('zone-1',), {'maxitems': MAX_RECORDS_PER_PAGE}), (('zone-2',), {'maxitems': MAX_RECORDS_PER_PAGE})] == \
+        route53.get_all_rrsets.call_args_list
+
+    # only the zone whose record set count changed is read again
+    route53.get_zones.return_value = [zone('example.org.', 'zone-1', '4'), zone('sub.example.org.', 'zone-2', '1')]
+    records['zone-1'].append(record('app.example.org.', 'CNAME', 'app-3', '0'))
+    index.refresh()
+    assert 3 == len(index.find('app.example.org'))
+    index.find('other.sub.example.org')
+    assert 3 == route53.get_all_rrsets.call_count
+
+    index.invalidate('other.sub.example.org')
+    index.find('other.sub.example.org')
+    assert 4 == route53.get_all_rrsets.call_count
+
+
+def test_wait_for_changes(monkeypatch):
+    route53 = MagicMock()
+    statuses = {'C1': ['PENDING', 'INSYNC'], 'C2': ['PENDING', 'PENDING', 'INSYNC']}
+    route53.get_change.side_effect = lambda change_id: {
+        'GetChangeResponse': {'ChangeInfo': {'Id': change_id, 'Status': statuses[change_id].pop(0)}}}
+    monkeypatch.setattr('boto.route53.connect_to_region', lambda region: route53)
+    sleep = MagicMock()
+    monkeypatch.setattr('time.sleep', sleep)
+
+    results = wait_for_changes('myregion', ['C1', 'C2'], 600)
+    assert [('C1', 'INSYNC'), ('C2', 'INSYNC')] == [(r['change_id'], r['status']) for r in results]
+    # first poll after CHANGE_POLL_DELAY, exponential backoff, changes in sync are not polled again
+    assert [((1,), {}), ((2,), {}), ((4,), {})] == sleep.call_args_list
+    assert 5 == route53.get_change.call_count
+
+
+def test_wait_for_changes_timeout(monkeypatch):
+    route53 = MagicMock()
+    route53.get_change.return_value = {'GetChangeResponse': {'ChangeInfo': {'Status': 'PENDING'}}}
+    monkeypatch.setattr('boto.route53.connect_to_region', lambda region: route53)
+    monkeypatch.setattr('time.sleep', MagicMock())
+
+    assert [{'change_id': 'C1', 'status': 'PENDING', 'seconds': None}] == wait_for_changes('myregion', ['C1'], 0)
@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+# modules which must not be loaded just to parse the command line (e.g. "senza --version")
+HEAVY_MODULES = frozenset(['boto', 'boto3', 'botocore', 'requests', 'pierone'])
+
+# generous upper bound for the cumulative "import senza.cli" time in microseconds
+MAX_IMPORT_TIME = int(os.environ.get('SENZA_MAX_IMPORT_TIME', 500000))
+
+
+def get_import_times(module: str) -> dict:
+    '''Import the module in a fresh interpreter and return the cumulative import time (us) of all loaded modules'''
+    output = subprocess.check_output([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+                                     stderr=subprocess.STDOUT, universal_newlines=True)
+    import_times = {}
+    for line in output.splitlines():
+        if line.startswith('import time:'):
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if cumulative.strip().isdigit():
+                import_times[name.strip()] = int(cumulative)
+    return import_times
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason='requires "python -X importtime"')
+def test_cli_startup():
+    import_times = get_import_times('senza.cli')
+
+    loaded_heavy_modules = set(name.split('.')[0] for name in import_times) & HEAVY_MODULES
+    assert not loaded_heavy_modules, 'these modules should be imported lazily by the commands'
+    assert import_times['senza.cli'] < MAX_IMPORT_TIME
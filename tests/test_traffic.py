@@ -1,6 +1,42 @@
+import json
 from unittest.mock import MagicMock
-from senza.aws import SenzaStackSummary
-from senza.traffic import get_stack_versions, StackVersion
+
+import click
+import pytest
+from boto.route53.record import Record
+from click.testing import CliRunner
+from clickclick import OutputFormat
+from senza.aws import SenzaStackSummary, StackReference
+from senza.cli import cli
+from senza.traffic import get_stack_versions, StackVersion, RecordChange, add_record_changes, update_records, \
+    change_traffic_batch, ramp_version_traffic, get_zone
+
+
+def record(name: str, identifier: str, weight: str):
+    return Record('{}.example.org.'.format(name), 'CNAME', 20, ['{}.elb'.format(identifier)],
+                  identifier=identifier, weight=weight)
+
+
+def stack_versions(name: str) -> list:
+    return [StackVersion(name, version, '{}.example.org'.format(name), '{}-{}.elb'.format(name, version))
+            for version in ('v1', 'v2')]
+
+
+@pytest.fixture
+def route53(monkeypatch):
+    '''Route53 with the hosted zone example.org (records: get_all_rrsets), every stack has the versions v1 and v2'''
+    zone = MagicMock(id='zone-1')
+    zone.name = 'example.org.'
+    route53 = MagicMock()
+    route53.get_zones.return_value = [zone]
+    monkeypatch.setattr('boto.route53.connect_to_region', lambda region: route53)
+    monkeypatch.setattr('senza.traffic.get_stack_versions', lambda name, region: stack_versions(name))
+    return route53
+
+
+def test_get_zone_not_found(route53):
+    with pytest.raises(ValueError, match='Zone for domain localhost not found'):
+        get_zone('my-region', 'localhost')
 
 
 def test_get_stack_versions(monkeypatch):
@@ -17,12 +53,199 @@ def test_get_stack_versions(monkeypatch):
     stack = MagicMock(stack_name='my-stack-1')
     cf.describe_stacks.return_value = [MagicMock(tags={'StackVersion': '1'})]
     cf.describe_stack_resources.return_value = [
-        MagicMock(resource_type='AWS::ElasticLoadBalancing::LoadBalancer'),
+        MagicMock(resource_type='AWS::ElasticLoadBalancing::LoadBalancer', physical_resource_id='my-stack-1'),
         MagicMock(resource_type='AWS::Route53::RecordSet', physical_resource_id='myapp.example.org')
     ]
-    elb.get_all_load_balancers.return_value = [MagicMock(dns_name='elb-dns-name')]
+    lb = MagicMock(dns_name='elb-dns-name')
+    lb.name = 'my-stack-1'
+    elb.get_all_load_balancers.return_value = [lb]
     monkeypatch.setattr('senza.traffic.get_stacks', MagicMock(
         return_value=[SenzaStackSummary(stack), SenzaStackSummary(MagicMock(stack_status='ROLLBACK_COMPLETE'))]))
     stack_version = list(get_stack_versions('my-stack', 'my-region'))
 
     assert stack_version == [StackVersion('my-stack', '1', 'myapp.example.org', 'elb-dns-name')]
+
+
+def test_get_stack_versions_batch(monkeypatch):
+    cf = MagicMock()
+    elb = MagicMock()
+    monkeypatch.setattr('boto.cloudformation.connect_to_region', MagicMock(return_value=cf))
+    monkeypatch.setattr('boto.ec2.elb.connect_to_region', MagicMock(return_value=elb))
+
+    stacks = [SenzaStackSummary(MagicMock(stack_name='my-stack-{}'.format(i), stack_id='id-{}'.format(i),
+                                          stack_status='CREATE_COMPLETE')) for i in range(5)]
+    monkeypatch.setattr('senza.traffic.get_stacks', MagicMock(return_value=stacks))
+    cf.describe_stacks.side_effect = lambda stack_id: [MagicMock(tags={'StackVersion': stack_id[3:]})]
+    cf.describe_stack_resources.side_effect = lambda stack_id: [
+        MagicMock(resource_type='AWS::ElasticLoadBalancing::LoadBalancer',
+                  physical_resource_id='my-stack-{}'.format(stack_id[3:]))]
+
+    def load_balancer(name):
+        lb = MagicMock(dns_name='{}.elb.amazonaws.com'.format(name))
+        lb.name = name
+        return lb
+    elb.get_all_load_balancers.side_effect = lambda names: [load_balancer(name) for name in names]
+
+    versions = list(get_stack_versions('my-stack', 'my-region'))
+
+    assert ['0', '1', '2', '3', '4'] == [version.version for version in versions]
+    assert 'my-stack-3.elb.amazonaws.com' == versions[3].lb_dns_name
+    # a single DescribeLoadBalancers call for all versions
+    elb.get_all_load_balancers.assert_called_once_with(['my-stack-{}'.format(i) for i in range(5)])
+
+
+def test_change_traffic_batch(route53):
+    route53.get_all_rrsets.return_value = [record('app1', 'app1-v1', '200'), record('app2', 'app2-v1', '200')]
+
+    change_traffic_batch([(StackReference('app1', 'v2'), 100), (StackReference('app2', 'v2'), 50)], 'myregion')
+
+    # one zone snapshot and a single change batch for both domains
+    assert 1 == route53.get_all_rrsets.call_count
+    route53.change_rrsets.assert_called_once()
+    zone_id, xml = route53.change_rrsets.call_args[0]
+    assert 'zone-1' == zone_id
+    assert 4 == xml.count('<Change>')
+    assert 'app1-v2.elb' in xml and 'app2-v2.elb' in xml
+
+
+def test_ramp_version_traffic(monkeypatch, route53):
+    route53.get_all_rrsets.return_value = [record('app', 'app-v1', '200')]
+    sleep = MagicMock()
+    monkeypatch.setattr('time.sleep', sleep)
+
+    def fail_at_third_step(version):
+        # like the --min-healthy check
+        if sleep.call_count == 2:
+            raise click.ClickException('{} not healthy'.format(version.identifier))
+
+    with pytest.raises(click.ClickException, match='app-v2 not healthy'):
+        ramp_version_traffic(StackReference('app', 'v2'), [10, 25, 50, 100], 300, 'myregion', fail_at_third_step)
+
+    # the zone's records are read once for all steps
+    assert 1 == route53.get_all_rrsets.call_count
+    assert 2 == route53.change_rrsets.call_count
+    assert [((300,), {}), ((300,), {})] == sleep.call_args_list
+    xml = route53.change_rrsets.call_args[0][1]
+    assert '<Weight>50</Weight>' in xml and '<Weight>150</Weight>' in xml
+
+    # started again, the ramp continues at the step after 25%
+    route53.get_all_rrsets.return_value = [record('app', 'app-v1', '150'), record('app', 'app-v2', '50')]
+    route53.change_rrsets.reset_mock()
+    ramp_version_traffic(StackReference('app', 'v2'), [10, 25, 50, 100], 300, 'myregion')
+    assert 2 == route53.change_rrsets.call_count
+    xml = route53.change_rrsets.call_args[0][1]
+    assert '<Action>DELETE</Action>' in xml and '<Weight>200</Weight>' in xml
+
+
+def test_update_records():
+    v1 = record('app', 'app-v1', '200')
+    v2 = record('app', 'app-v2', '0')
+    rr = [v1, v2]
+    record_changes = [RecordChange('UPSERT', v1, 'app.example.org.', 'app-v1', 150, v1.resource_records),
+                      RecordChange('DELETE', v2, 'app.example.org.', 'app-v2', '0', v2.resource_records),
+                      RecordChange('CREATE', None, 'app.example.org.', 'app-v3', 50, ['app-v3.elb'])]
+    changes = MagicMock()
+    add_record_changes(changes, record_changes)
+    update_records(rr, record_changes)
+
+    assert 150 == changes.add_change_record.call_args_list[0][0][1].weight
+    assert [('app-v1', 150), ('app-v3', 50)] == [(r.identifier, r.weight) for r in rr]
+    # the records shared with the record index are not changed
+    assert '200' == v1.weight
+
+
+def test_ramp_version_traffic_wait(monkeypatch, capsys, route53):
+    route53.get_all_rrsets.return_value = [record('app', 'app-v1', '200')]
+    route53.change_rrsets.side_effect = [
+        {'ChangeResourceRecordSetsResponse': {'ChangeInfo': {'Id': '/change/C{}'.format(i)}}} for i in (1, 2)]
+    route53.get_change.side_effect = lambda change_id: {
+        'GetChangeResponse': {'ChangeInfo': {'Id': change_id, 'Status': 'INSYNC'}}}
+    monkeypatch.setattr('time.sleep', MagicMock())
+
+    with OutputFormat('tsv'):
+        ramp_version_traffic(StackReference('app', 'v2'), [50, 100], 300, 'myregion', wait_timeout=600)
+
+    # the status of every step's change is printed
+    out = capsys.readouterr()[0]
+    assert ['C1\tINSYNC', 'C2\tINSYNC'] == [line.rsplit('\t', 1)[0] for line in out.splitlines()
+                                            if line.startswith('C')]
+
+
+@pytest.mark.parametrize('args', [['50'], ['--steps', '25,50']])
+def test_traffic_wait_json(monkeypatch, capsys, route53, args):
+    route53.get_all_rrsets.return_value = [record('app', 'app-v1', '200')]
+    route53.change_rrsets.side_effect = [
+        {'ChangeResourceRecordSetsResponse': {'ChangeInfo': {'Id': '/change/C{}'.format(i)}}} for i in (1, 2)]
+    route53.get_change.side_effect = lambda change_id: {
+        'GetChangeResponse': {'ChangeInfo': {'Id': change_id, 'Status': 'INSYNC'}}}
+    monkeypatch.setattr('time.sleep', MagicMock())
+
+    # CliRunner (click 6) mixes stderr into the output: stdout must be a single JSON document
+    cli.main(['traffic', 'app', 'v2'] + args + ['--wait', '-o', 'json', '--region=eu-west-1'],
+             standalone_mode=False)
+    out, err = capsys.readouterr()
+    change_ids = ['C1', 'C2'][:len(args)]
+    assert change_ids == [status['change_id'] for status in json.loads(out)]
+    assert all('INSYNC' == status['status'] for status in json.loads(out))
+    assert 'new_weight%' in err
+
+
+def test_simulate_traffic(monkeypatch, tmpdir, capsys):
+    def no_aws(region):
+        raise AssertionError('AWS must not be called')
+
+    for service in ('route53', 'cloudformation', 'ec2', 'ec2.elb'):
+        monkeypatch.setattr('boto.{}.connect_to_region'.format(service), no_aws)
+
+    def record(name, identifier, weight):
+        return {'Name': name, 'Type': 'CNAME', 'TTL': 20, 'SetIdentifier': identifier, 'Weight': weight,
+                'ResourceRecords': [{'Value': '{}.elb'.format(identifier)}]}
+
+    zone_file = tmpdir.join('zone.json')
+    zone_file.write(json.dumps({
+        'HostedZone': {'Id': '/hostedzone/Z1', 'Name': 'example.org.'},
+        'ResourceRecordSets': [{'Name': 'example.org.', 'Type': 'SOA', 'TTL': 900,
+                                'ResourceRecords': [{'Value': 'ns.example.org.'}]},
+                               record('app.example.org.', 'app-v1', 150),
+                               record('app.example.org.', 'app-v2', 50)],
+        'StackVersions': [{'name': 'app', 'version': 'v{}'.format(i), 'domain': 'app.example.org',
+                           'lb_dns_name': 'app-v{}.elb'.format(i)} for i in range(1, 4)]}))
+
+    # stdout is a single JSON document with the change batches (the new weights are printed to stderr)
+    cli.main(['traffic', 'app', 'v3', '50', '--simulate', str(zone_file), '-o', 'json'], standalone_mode=False)
+    out, err = capsys.readouterr()
+    assert [{'change_batch': 1, 'action': 'UPSERT', 'dns_name': 'app.example.org.', 'identifier': 'app-v1',
+             'weight': 75, 'values': 'app-v1.elb'},
+            {'change_batch': 1, 'action': 'UPSERT', 'dns_name': 'app.example.org.', 'identifier': 'app-v2',
+             'weight': 25, 'values': 'app-v2.elb'},
+            {'change_batch': 1, 'action': 'CREATE', 'dns_name': 'app.example.org.', 'identifier': 'app-v3',
+             'weight': 100, 'values': 'app-v3.elb'}] == json.loads(out)
+    assert '"new_weight%": 50.0' in err
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ['traffic', 'app', '--simulate', str(zone_file)])
+    assert 'requires the stack name, version and percentage' in result.output
+
+    # only weighted CNAME records can be changed
+    zone_file.write(json.dumps({
+        'ResourceRecordSets': [{'Name': 'app.example.org.', 'Type': 'CNAME', 'TTL': 20,
+                                'ResourceRecords': [{'Value': 'app-v1.elb'}]}],
+        'StackVersions': []}))
+    result = runner.invoke(cli, ['traffic', 'app', 'v1', '50', '--simulate', str(zone_file)])
+    assert 'CNAME record app.example.org. has no Weight' in result.output
+    assert 2 == result.exit_code
+
+
+def test_traffic_ramp_options(tmpdir):
+    batch_file = tmpdir.join('batch.yaml')
+    batch_file.write('[]')
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ['traffic', '--batch', str(batch_file), '--steps', '1,100'])
+    assert '--steps cannot be used with --batch' in result.output
+    assert 2 == result.exit_code
+
+    for option in (['--min-healthy', '2'], ['--interval', '1m']):
+        result = runner.invoke(cli, ['traffic', 'app', 'v2', '100'] + option)
+        assert '--interval and --min-healthy require --steps' in result.output
+        assert 2 == result.exit_code
@@ -0,0 +1,17 @@
+import pytest
+from pystache.context import KeyNotFoundError
+from senza.utils import pystache_render, parse_template
+
+
+def test_pystache_render_parses_template_once():
+    parse_template.cache_clear()
+    for i in range(10):
+        assert 'v{}'.format(i) == pystache_render('v{{Version}}', {'Version': i})
+    info = parse_template.cache_info()
+    assert info.misses == 1
+    assert info.hits == 9
+
+
+def test_pystache_render_missing_tags():
+    with pytest.raises(KeyNotFoundError):
+        pystache_render('{{Unknown}}', {})
@@ -0,0 +1,72 @@
+import io
+import os
+from unittest.mock import MagicMock
+
+from senza.watch import Screen, Snapshot, get_stack_indicator
+
+
+def test_get_stack_indicator():
+    stack = MagicMock(stack_status='UPDATE_COMPLETE', LastUpdatedTime='2015-06-01T10:00:00Z')
+    assert ('UPDATE_COMPLETE', '2015-06-01T10:00:00Z') == get_stack_indicator(stack)
+    stack.stack_status = 'UPDATE_IN_PROGRESS'
+    assert get_stack_indicator(stack) is None
+
+
+def test_snapshot():
+    snapshot = Snapshot()
+    fetch = MagicMock(return_value=['row'])
+    assert ['row'] == snapshot.get('stack-1', 'a', fetch)
+    assert ['row'] == snapshot.get('stack-1', 'a', fetch)
+    assert 1 == fetch.call_count
+    # indicator moved
+    snapshot.get('stack-1', 'b', fetch)
+    assert 2 == fetch.call_count
+    # no indicator: always fetch
+    snapshot.get('stack-1', None, fetch)
+    snapshot.get('stack-1', None, fetch)
+    assert 4 == fetch.call_count
+    assert (4, 1) == (snapshot.fetches, snapshot.reuses)
+
+
+def test_snapshot_settled_and_max_age():
+    snapshot = Snapshot()
+    fetch = MagicMock(return_value={'i-1': 'OUT_OF_SERVICE'})
+    snapshot.get('stack-1', 'a', fetch, settled=lambda health: False)
+    snapshot.get('stack-1', 'a', fetch, settled=lambda health: False)
+    assert 2 == fetch.call_count
+
+    snapshot = Snapshot(max_age=0)
+    snapshot.get('stack-1', 'a', fetch)
+    snapshot.get('stack-1', 'a', fetch)
+    assert 4 == fetch.call_count
+
+
+class Terminal(io.StringIO):
+    def isatty(self):
+        return True
+
+
+def test_screen_redraws_changed_lines(monkeypatch):
+    monkeypatch.setattr('shutil.get_terminal_size', lambda: os.terminal_size((80, 24)))
+    terminal = Terminal()
+    screen = Screen(True, 'text', terminal)
+    assert screen.incremental
+
+    screen.update(['header', 'row 1', 'row 2'])
+    assert terminal.getvalue().startswith('\x1b[2J')
+
+    terminal.truncate(0)
+    terminal.seek(0)
+    screen.update(['header', 'row 1 changed'])
+    out = terminal.getvalue()
+    assert '\x1b[2J' not in out
+    assert 'header' not in out
+    assert '\x1b[2;1H\x1b[2Krow 1 changed' in out
+    # the superfluous third line is removed
+    assert '\x1b[3;1H\x1b[J' in out
+
+
+def test_screen_not_incremental():
+    assert not Screen(True, 'text', io.StringIO()).incremental
+    assert not Screen(True, 'json', Terminal()).incremental
+    assert not Screen(False, 'text', Terminal()).incremental
@@ -0,0 +1,99 @@
+import random
+
+import pytest
+from senza.weights import solve_weights, MIN_WEIGHT
+
+TOTAL = 200
+
+# property checks on generated inputs (seeded, i.e. every run checks the same examples)
+EXAMPLES = 500
+
+
+def generate_weights(rnd: random.Random, dark_versions: int = 3) -> dict:
+    '''Random weights summing up to TOTAL for some versions, others without traffic ("dark")'''
+    lit = rnd.randint(1, 8)
+    cuts = sorted(rnd.sample(range(1, TOTAL), lit - 1))
+    weights = {'v{:03d}'.format(i): b - a for i, (a, b) in enumerate(zip([0] + cuts, cuts + [TOTAL]))}
+    for i in range(lit, lit + rnd.randint(0, dark_versions)):
+        weights['v{:03d}'.format(i)] = 0
+    return weights
+
+
+def generate_examples(seed: int, dark_versions: int = 3):
+    rnd = random.Random(seed)
+    for i in range(EXAMPLES):
+        weights = generate_weights(rnd, dark_versions)
+        identifier = rnd.choice(sorted(weights))
+        percentage = rnd.randint(0, TOTAL)
+        priorities = {i: int(i[1:]) for i in weights}
+        yield weights, identifier, percentage, priorities
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_solve_weights_properties(seed):
+    for weights, identifier, percentage, priorities in generate_examples(seed):
+        new_weights = solve_weights(weights, identifier, percentage, TOTAL, priorities)
+        others = [i for i in weights if i != identifier]
+        lit = [i for i in others if weights[i] > 0]
+
+        assert sorted(weights) == sorted(new_weights)
+        if lit or percentage > 0:
+            assert TOTAL == sum(new_weights.values())
+        else:
+            assert 0 == sum(new_weights.values())
+        for i in others:
+            if weights[i] == 0:
+                # dark versions stay dark
+                assert 0 == new_weights[i]
+            elif percentage < TOTAL:
+                # versions with traffic keep traffic
+                assert new_weights[i] >= MIN_WEIGHT
+        if lit and percentage < TOTAL:
+            assert min(percentage, TOTAL - MIN_WEIGHT * len(lit)) == new_weights[identifier]
+
+        # independent of the order of the input
+        shuffled = list(weights.items())
+        random.Random(seed).shuffle(shuffled)
+        assert new_weights == solve_weights(dict(shuffled), identifier, percentage, TOTAL, priorities)
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_solve_weights_monotone(seed):
+    for weights, identifier, percentage, priorities in generate_examples(seed):
+        lower = solve_weights(weights, identifier, percentage, TOTAL, priorities)
+        higher = solve_weights(weights, identifier, min(TOTAL, percentage + 1), TOTAL, priorities)
+        # giving the version more traffic never gives any other version more traffic
+        for i in weights:
+            if i != identifier:
+                assert higher[i] <= lower[i]
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_solve_weights_proportional(seed):
+    for weights, identifier, percentage, priorities in generate_examples(seed):
+        new_weights = solve_weights(weights, identifier, percentage, TOTAL, priorities)
+        lit = [i for i in weights if i != identifier and weights[i] > 0]
+        # the versions with more traffic before never get less traffic than versions with less traffic
+        for a in lit:
+            for b in lit:
+                if weights[a] > weights[b]:
+                    assert new_weights[a] >= new_weights[b]
+
+
+def test_solve_weights_many_dark_versions():
+    weights = {'v{:03d}'.format(i): 0 for i in range(500)}
+    weights.update({'v001': 150, 'v002': 50})
+    new_weights = solve_weights(weights, 'v499', 20, TOTAL)
+    assert {'v001': 135, 'v002': 45, 'v499': 20} == {i: w for i, w in new_weights.items() if w}
+
+
+def test_solve_weights_ties():
+    # equal weights: the remainder goes to the version with the higher priority
+    assert {'v1': 66, 'v2': 67, 'v3': 67} == solve_weights({'v1': 100, 'v2': 100, 'v3': 0}, 'v3', 67, TOTAL,
+                                                           {'v1': 'v1', 'v2': 'v2', 'v3': 'v3'})
+
+
+def test_solve_weights_too_many_versions():
+    weights = {'v{:03d}'.format(i): 1 for i in range(TOTAL + 2)}
+    with pytest.raises(ValueError):
+        solve_weights(weights, 'v000', 10, TOTAL)